@@ -53,12 +53,22 @@ from carla import ColorConverter as cc
 #
 import argparse
 import collections
+import concurrent.futures
+import contextlib
+import csv
 import datetime
+import functools
+import itertools
+import json
 import logging
 import math
+import queue
 import random
 import re
+import threading
+import tracemalloc
 import weakref
+from multiprocessing import shared_memory
 
 try:
     import pygame
@@ -73,6 +83,7 @@ try:
     from pygame.locals import K_DOWN
     from pygame.locals import K_ESCAPE
     from pygame.locals import K_F1
+    from pygame.locals import K_F2
     from pygame.locals import K_LEFT
     from pygame.locals import K_PERIOD
     from pygame.locals import K_RIGHT
@@ -110,6 +121,38 @@ LANE_VIOLATION_PENALTY = 5 # Base penalty for minor lane issues
 ONCOMING_TRAFFIC_PENALTY_MULTIPLIER = 3 # Multiply base for oncoming
 SOLID_LINE_CROSSING_PENALTY_MULTIPLIER = 1.5 # Multiply base for solid line
 COLLISION_COOLDOWN_SECONDS = 2.0 # Seconds between collision penalties
+COLLISION_HISTORY_CAPACITY = 4096 # Most recent collision events kept for the session (oldest overwritten)
+
+# +------------------------------------------------------------------------------+
+# | Recording Constants                                                          |
+# +------------------------------------------------------------------------------+
+RECORD_CHUNK_FRAMES = 8 # Frames per chunk file
+RECORD_QUEUE_CHUNKS = 4 # Shared-memory chunk buffers; frames are dropped when all are waiting on writers
+RECORD_WORKERS = 2 # Writer processes
+VIDEO_QUEUE_FRAMES = 8 # Frames buffered for the video encoder before new ones are skipped
+
+# +------------------------------------------------------------------------------+
+# | Lidar Constants                                                              |
+# +------------------------------------------------------------------------------+
+LIDAR_RANGE = 50.0 # Metres; also sets the scale of the bird's-eye view
+LIDAR_FRAME_BUDGET_MS = 4.0 # Per-point drawing time above which the next sweeps are decimated
+LIDAR_DENSITY_DECAY = 0.85 # Fraction of the accumulated point density kept per sweep
+
+# Channel masks of a 32-bit surface whose memory layout matches CARLA's BGRA camera buffers (little-endian)
+BGRA_MASKS = (0x00FF0000, 0x0000FF00, 0x000000FF, 0)
+
+# ADDED: Lane geometry index
+LANE_INDEX_SPACING = 2.0 # Metres between lane-center samples from Map.generate_waypoints
+LANE_INDEX_LEAF_SIZE = 16 # Samples per KD-tree leaf, searched with one vectorized distance computation
+
+# ADDED: Alert audio
+AUDIO_FREQUENCY = 44100
+AUDIO_BUFFER_SAMPLES = 256 # Mixer buffer; pygame's default of 512+ adds >11 ms before a sound is heard
+AUDIO_CHANNELS = 8
+AUDIO_RESERVED_CHANNELS = 2 # Kept free of ordinary alerts for critical events
+
+# ADDED: Font path cache (skips pygame's system font scan on warm starts)
+FONT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'carla_sim_fonts.json')
 
 # +------------------------------------------------------------------------------+
 # | Global Functions                                                             |
@@ -129,15 +172,352 @@ def get_actor_display_name(actor, truncate=250):
     return (name[:truncate - 1] + u'\u2026') if len(name) > truncate else name
 
 
+@functools.lru_cache(maxsize=32)
+def load_font(path, size, bold=False):
+    """
+    Process-wide pygame Font cache keyed by (path, size, bold); opening a Font reads and parses the font file.
+    `bold` is pygame's synthetic bold. Fonts are invalid after pygame.quit(); game_loop clears the cache before it.
+    """
+    font = pygame.font.Font(path, size)
+    font.set_bold(bold)
+    return font
+
+
+class FontPathCache(object):
+    """
+    On-disk cache of resolved font paths keyed by (font-name list, bold). An entry is trusted while its font file
+    still has the recorded mtime; otherwise `scan(names, bold)` runs (pygame's match_font/get_fonts, which
+    enumerate the system fonts through fontconfig on first use) and the result is written back.
+    """
+    def __init__(self, path=FONT_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(names, bold):
+        return f"{'bold' if bold else 'regular'}:{','.join(names)}"
+
+    @staticmethod
+    def _mtime(font_path):
+        # Bare names such as pygame's default font, and None (pygame's default), carry no mtime
+        return os.path.getmtime(font_path) if font_path and os.path.isabs(font_path) else None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not write font cache '{self.path}': {e}")
+
+    def resolve(self, names, bold, scan):
+        key = self._key(names, bold)
+        with self._lock:
+            entry = self._load().get(key)
+            if entry:
+                try:
+                    if self._mtime(entry['path']) == entry['mtime']:
+                        self.hits += 1
+                        return entry['path']
+                except (OSError, KeyError, TypeError):
+                    pass # Font removed or entry malformed; rescan
+            self.misses += 1
+            font_path = scan(names, bold)
+            try:
+                self._entries[key] = {'path': font_path, 'mtime': self._mtime(font_path)}
+            except OSError:
+                return font_path # Unreadable result; use it this run but don't persist it
+            self._save()
+            return font_path
+
+
+FONT_PATH_CACHE = FontPathCache()
+
+
+def copy_bgra_to_surface(raw_data, surface):
+    """Copies a CARLA BGRA buffer into a BGRA_MASKS surface of the same size: one memcpy, no intermediate arrays."""
+    pixels = np.asarray(surface.get_view('1')).view(np.uint8)
+    np.copyto(pixels, np.frombuffer(raw_data, dtype=np.uint8))
+    del pixels # Releases the surface lock before the surface is blitted
+
+
+def blit_camera_surface(display, surface):
+    """Draws a camera frame over the whole display, upscaling (nearest neighbour) frames rendered below display size."""
+    if surface.get_size() == display.get_size():
+        display.blit(surface, (0, 0))
+    else:
+        pygame.transform.scale(surface, display.get_size(), display)
+
+
+def benchmark_frame_path(width, height, frames=100):
+    """Compares the legacy numpy/make_surface camera conversion with copy_bgra_to_surface (no CARLA server needed)."""
+    raw_data = bytes(np.random.randint(0, 256, width * height * 4, dtype=np.uint8))
+
+    def legacy(raw):
+        array = np.frombuffer(raw, dtype=np.dtype("uint8"))
+        array = np.reshape(array, (height, width, 4))
+        array = array[:, :, :3]
+        array = array[:, :, ::-1]
+        return pygame.surfarray.make_surface(array.swapaxes(0, 1))
+
+    def reused(raw):
+        copy_bgra_to_surface(raw, surface)
+        return surface
+
+    surface = pygame.Surface((width, height), 0, 32, BGRA_MASKS)
+    results = []
+    for name, convert in (('legacy make_surface', legacy), ('copy_bgra_to_surface', reused)):
+        convert(raw_data) # Warm-up
+        start = time.perf_counter()
+        for _ in range(frames):
+            convert(raw_data)
+        ms_per_frame = (time.perf_counter() - start) * 1000.0 / frames
+        # Separate, untimed pass: tracemalloc sees Python/NumPy buffers but not the pixel memory SDL allocates
+        # for a surface, so new surfaces are counted by identity (the previous one is kept alive for the check)
+        heap_bytes, surface_bytes, previous = 0, 0, convert(raw_data)
+        tracemalloc.start()
+        for _ in range(frames):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = convert(raw_data)
+            heap_bytes += tracemalloc.get_traced_memory()[1] - before
+            if result is not previous:
+                surface_bytes += result.get_pitch() * result.get_height()
+            previous = result
+        tracemalloc.stop()
+        results.append((name, ms_per_frame, heap_bytes / frames / 1e6, surface_bytes / frames / 1e6))
+    print(f"Camera frame path benchmark, {width}x{height}, {frames} frames (measured per frame)")
+    for name, ms_per_frame, heap_mb, surface_mb in results:
+        print(f"  {name:<22} {ms_per_frame:7.2f} ms, {surface_mb:6.2f} MB new surface memory, {heap_mb:6.2f} MB Python/NumPy heap")
+    return results
+
+
+def benchmark_lane_index(xodr_path, queries=20000):
+    """Builds a LaneGeometryIndex from an OpenDRIVE file and measures nearest-lane queries (no CARLA server needed)."""
+    start = time.perf_counter()
+    index = LaneGeometryIndex.from_xodr(xodr_path)
+    build_s = time.perf_counter() - start
+    # Query points scattered up to 5 m around random lane samples
+    points = index.xyz[np.random.randint(0, len(index), queries)] + np.random.uniform(-5.0, 5.0, (queries, 3)) * (1, 1, 0)
+    start = time.perf_counter()
+    index.nearest_many(points)
+    rate = queries / (time.perf_counter() - start)
+    print(f"Lane index benchmark, {xodr_path}: {len(index)} samples every {LANE_INDEX_SPACING:g} m, built in {build_s:.2f} s")
+    print(f"  nearest lane {rate:,.0f} queries/s ({1e6 / rate:.1f} us/query)")
+    return rate
+
+
+# +------------------------------------------------------------------------------+
+# | Image Converters                                                             |
+# +------------------------------------------------------------------------------+
+# Client-side replacements for image.convert(cc.Depth / cc.LogarithmicDepth / cc.CityScapesPalette). The
+# lookup tables are built once and each conversion is a single np.take from the raw BGRA buffer into the
+# surface, so the sensor image is never modified. Depth is 24-bit, normalized = (R + G*256 + B*65536) / (2^24 - 1),
+# with 1.0 at 1000 m; semantic segmentation carries the class id in the red channel.
+DEPTH_FAR_METERS = 1000.0
+CITYSCAPES_PALETTE = [
+    (0, 0, 0), (128, 64, 128), (244, 35, 232), (70, 70, 70), (102, 102, 156), (190, 153, 153), (153, 153, 153),
+    (250, 170, 30), (220, 220, 0), (107, 142, 35), (152, 251, 152), (70, 130, 180), (220, 20, 60), (255, 0, 0),
+    (0, 0, 142), (0, 0, 70), (0, 60, 100), (0, 80, 100), (0, 0, 230), (119, 11, 32), (110, 190, 160),
+    (170, 120, 50), (55, 90, 80), (45, 60, 150), (157, 234, 50), (81, 0, 81), (150, 100, 100), (230, 150, 140),
+    (180, 165, 180)
+] # CARLA 0.9.14+ semantic tags 0-28, unknown ids draw black
+
+
+@functools.lru_cache(maxsize=None)
+def depth_gray_lut(logarithmic):
+    """Packed gray pixels indexed by the top 16 bits of a depth pixel, read as a little-endian (G << 8 | B) uint16."""
+    index = np.arange(65536, dtype=np.uint32)
+    # (index & 0xFF) is B, the most significant depth byte; the R byte is below display precision and is dropped
+    normalized = ((index & 0xFF) * 65536 + (index >> 8) * 256 + 128).astype(np.float64) / (2 ** 24 - 1)
+    if logarithmic:
+        normalized = np.clip(1.0 + np.log(normalized) / 5.70378, 0.005, 1.0) # Same curve as cc.LogarithmicDepth
+    gray = (normalized * 255.0).astype(np.uint32)
+    return (gray << 16) | (gray << 8) | gray
+
+
+@functools.lru_cache(maxsize=None)
+def depth_meter_luts():
+    """Metres contributed by the (G << 8 | B) uint16 and by the R byte of a depth pixel."""
+    scale = DEPTH_FAR_METERS / (2 ** 24 - 1)
+    index = np.arange(65536, dtype=np.float64)
+    high = ((index % 256) * 65536 + (index // 256) * 256) * scale
+    low = np.arange(256, dtype=np.float64) * scale
+    return high.astype(np.float32), low.astype(np.float32)
+
+
+@functools.lru_cache(maxsize=None)
+def cityscapes_lut():
+    colors = np.zeros((256, 3), dtype=np.uint32)
+    colors[:len(CITYSCAPES_PALETTE)] = CITYSCAPES_PALETTE
+    return (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+
+
+def _surface_pixels(surface):
+    return np.asarray(surface.get_view('1')).view(np.uint32)
+
+
+def convert_depth_gray(raw_data, surface):
+    pixels = _surface_pixels(surface)
+    np.take(depth_gray_lut(False), np.frombuffer(raw_data, dtype=np.uint16)[::2], out=pixels, mode='clip')
+    del pixels # Releases the surface lock before the surface is blitted
+
+
+def convert_log_depth_gray(raw_data, surface):
+    pixels = _surface_pixels(surface)
+    np.take(depth_gray_lut(True), np.frombuffer(raw_data, dtype=np.uint16)[::2], out=pixels, mode='clip')
+    del pixels
+
+
+def convert_cityscapes(raw_data, surface):
+    pixels = _surface_pixels(surface)
+    np.take(cityscapes_lut(), np.frombuffer(raw_data, dtype=np.uint8)[2::4], out=pixels, mode='clip')
+    del pixels
+
+
+def decode_depth(raw_data, out, scratch):
+    """Decodes a depth image into `out` (float16 metres, H x W), using `scratch` (float32, 2 x H x W) for the sum."""
+    high, low = depth_meter_luts()
+    meters, fine = scratch[0].reshape(-1), scratch[1].reshape(-1)
+    np.take(high, np.frombuffer(raw_data, dtype=np.uint16)[::2], out=meters, mode='clip')
+    np.take(low, np.frombuffer(raw_data, dtype=np.uint8)[2::4], out=fine, mode='clip')
+    meters += fine
+    np.copyto(out.reshape(-1), meters)
+    return out
+
+
+CLIENT_CONVERTERS = {
+    cc.Depth: convert_depth_gray,
+    cc.LogarithmicDepth: convert_log_depth_gray,
+    cc.CityScapesPalette: convert_cityscapes,
+}
+
+
+# +------------------------------------------------------------------------------+
+# | Frame Profiler                                                               |
+# +------------------------------------------------------------------------------+
+class FrameProfiler(object):
+    """
+    Wall time per main-loop phase and per sensor callback, kept in fixed-size ring buffers.
+    F2 toggles the HUD overlay (p50/p95/p99), export_csv() writes percentiles and a histogram per phase.
+    """
+    PHASES = ('parse_events', 'hud_tick', 'spectator', 'camera_render', 'hud_render', 'flip',
+              'camera_callback', 'camera_convert', 'sensor_camera', 'sensor_collision', 'sensor_lane_invasion',
+              'sensor_rig', 'audio_latency')
+    HISTOGRAM_EDGES_MS = (0.0, 0.5, 1.0, 2.0, 4.0, 8.0, 16.7, 33.3, 50.0, 100.0, float('inf'))
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.show_overlay = False
+        self._samples = {phase: np.zeros(capacity, dtype=np.float64) for phase in self.PHASES}
+        self._counts = {phase: 0 for phase in self.PHASES}
+
+    def record(self, phase, seconds):
+        # Only PHASES (KeyError otherwise): the dicts are never resized, as callback threads record while the overlay iterates them
+        count = self._counts[phase]
+        self._samples[phase][count % self.capacity] = seconds * 1000.0
+        self._counts[phase] = count + 1
+
+    @contextlib.contextmanager
+    def measure(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def samples_ms(self, phase):
+        return self._samples[phase][:min(self._counts[phase], self.capacity)]
+
+    def percentiles(self, phase, q=(50, 95, 99)):
+        samples = self.samples_ms(phase)
+        if samples.size == 0:
+            return None
+        return np.percentile(samples, q)
+
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+
+    def overlay_lines(self):
+        lines = ['%-20s %6s %6s %6s' % ('PHASE (ms)', 'p50', 'p95', 'p99')]
+        for phase in self._samples:
+            p = self.percentiles(phase)
+            if p is not None:
+                lines.append('%-20s %6.2f %6.2f %6.2f' % (phase, p[0], p[1], p[2]))
+        return lines
+
+    def export_csv(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        edges = self.HISTOGRAM_EDGES_MS
+        bucket_names = ['hist_%g-%gms' % (lo, hi) for lo, hi in zip(edges[:-1], edges[1:])]
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['phase', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'] + bucket_names)
+            for phase in self._samples:
+                samples = self.samples_ms(phase)
+                if samples.size == 0:
+                    continue
+                p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+                histogram, _ = np.histogram(samples, bins=edges)
+                writer.writerow([phase, self._counts[phase], '%.3f' % samples.mean(), '%.3f' % p50, '%.3f' % p95,
+                                 '%.3f' % p99, '%.3f' % samples.max()] + histogram.tolist())
+        logging.info(f"Frame profile exported to {path}")
+
+
+def profile_callback(phase):
+    """Decorator for static sensor callbacks taking (weak_self, data, ...); records their duration on the owner's HUD profiler."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(weak_self, data, *args):
+            start = time.perf_counter()
+            try:
+                return func(weak_self, data, *args)
+            finally:
+                owner = weak_self()
+                if owner is not None and owner.hud is not None:
+                    owner.hud.profiler.record(phase, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
 # +------------------------------------------------------------------------------+
 # | World Class                                                                  |
 # +------------------------------------------------------------------------------+
 
 
 class World(object):
-    def __init__(self, carla_world, hud, actor_filter, fov): # MODIFIED: Added fov argument
+    def __init__(self, carla_world, hud, actor_filter, fov, sync_mode=None, spectator_follower=None,
+                 render_scale=1.0, render_scale_controller=None, video_sink=None, rig_streams=None,
+                 rig_consumers=(), warm_sensors=0): # MODIFIED: Added fov argument
         self.world = carla_world
         self.hud = hud
+        self.sync_mode = sync_mode # ADDED: CarlaSyncMode when running with --sync, else None
+        self.spectator_follower = spectator_follower # ADDED: None disables spectator tracking
+        self.state_cache = ActorStateCache() # ADDED: Player state read once per tick for HUD and sensors
+        self.collision_history = CollisionHistory() # ADDED: Session-wide, survives player restarts
+        self.render_scale = render_scale # ADDED: Camera image size as a fraction of the display size
+        self.render_scale_controller = render_scale_controller # ADDED: Set for --render-scale auto
+        self.video_sink = video_sink # ADDED: VideoRecorder fed with raw camera frames (--record-video-source camera)
+        self.rig_streams = rig_streams # ADDED: RigStreams captured by a SensorRig (--rig, synchronous mode only)
+        self.rig_consumers = list(rig_consumers) # ADDED: Called with every RigBundle, outlive player restarts
+        self.warm_sensors = warm_sensors # ADDED: Idle sensors kept spawned either side of the displayed one (--warm-sensors)
+        self.sensor_rig = None
         self.player = None
         self.collision_sensor = None
         self.lane_invasion_sensor = None
@@ -147,9 +527,23 @@ class World(object):
         self._weather_index = 0
         self._actor_filter = actor_filter
         self.fov = fov  # ADDED: Store fov
+        # ADDED: Lane geometry index for lane violations and the HUD lane offset, built off the main thread;
+        # until it is ready the cache falls back to Map.get_waypoint()
+        threading.Thread(target=self._build_lane_index, args=(self.state_cache.get_map(self.world),),
+                         name='LaneIndexBuilder', daemon=True).start()
         self.restart()
         self.world.on_tick(hud.on_world_tick)
 
+    def _build_lane_index(self, carla_map):
+        start = time.perf_counter()
+        try:
+            index = LaneGeometryIndex.for_map(carla_map)
+        except Exception as e:
+            logging.warning(f"Lane geometry index unavailable, using server waypoints: {e}")
+            return
+        self.state_cache.lane_index = index
+        logging.info(f"Lane geometry index for {carla_map.name}: {len(index)} samples in {time.perf_counter() - start:.2f} s")
+
     def restart(self):
         # Keep same camera config if the camera manager exists.
         cam_index = self.camera_manager.index if self.camera_manager is not None else 0
@@ -172,7 +566,7 @@ class World(object):
             self.player = self.world.try_spawn_actor(blueprint, spawn_point)
         
         while self.player is None:
-            spawn_points = self.world.get_map().get_spawn_points()
+            spawn_points = self.state_cache.get_map(self.world).get_spawn_points()
             spawn_point = random.choice(spawn_points) if spawn_points else carla.Transform()
             self.player = self.world.try_spawn_actor(blueprint, spawn_point)
 
@@ -183,13 +577,21 @@ class World(object):
         self.hud.reset() 
 
         # Set up the sensors for the new player
-        self.collision_sensor = CollisionSensor(self.player, self.hud)
-        self.lane_invasion_sensor = LaneInvasionSensor(self.player, self.hud)
+        # In synchronous mode the sensors push into per-sensor frame queues instead of handling data on the callback thread
+        sync = self.sync_mode
+        self.collision_sensor = CollisionSensor(self.player, self.hud, frame_queue=sync.queue('collision') if sync else None,
+                                                history=self.collision_history, state_cache=self.state_cache)
+        self.lane_invasion_sensor = LaneInvasionSensor(self.player, self.hud, frame_queue=sync.queue('lane_invasion') if sync else None,
+                                                       state_cache=self.state_cache)
         self.gnss_sensor = GnssSensor(self.player)
         # MODIFIED: Pass fov to CameraManager
-        self.camera_manager = CameraManager(self.player, self.hud, self.fov) 
+        self.camera_manager = CameraManager(self.player, self.hud, self.fov, frame_queue=sync.queue('camera') if sync else None,
+                                            render_scale=self.render_scale, video_sink=self.video_sink,
+                                            warm_sensors=0 if self.hud.headless else self.warm_sensors) # Never switched headless
         self.camera_manager.transform_index = cam_pos_index
         self.camera_manager.set_sensor(cam_index, notify=False)
+        if self.rig_streams and sync:
+            self.sensor_rig = SensorRig(self.player, self.rig_streams, sync, self.fov, consumers=self.rig_consumers)
         
         actor_type = get_actor_display_name(self.player)
         self.hud.notification(f"{actor_type} Ready!")
@@ -202,31 +604,62 @@ class World(object):
         self.hud.notification('Weather: %s' % preset[1])
         self.player.get_world().set_weather(preset[0])
 
-    def tick(self, clock):
-        self.hud.tick(self, clock)
-        if self.player is not None and isinstance(self.player, carla.Vehicle):
-            spectator = self.world.get_spectator()
-            vehicle_transform = self.player.get_transform()
-            
-            driver_seat_offset_location = carla.Location(x=0.8, y=-0.4, z=1.3) # Adjusted for a more typical driver view
-
-            # Apply the vehicle's rotation to the offset vector using transform_vector
-            rotated_offset = vehicle_transform.transform_vector(driver_seat_offset_location)
-            # Add the rotated offset vector to the vehicle's world location
-            spectator_location = vehicle_transform.location + rotated_offset
-            # Create the spectator transform using the new location and the vehicle's rotation
-            # The rotation is set to the vehicle's rotation to always look forward from the driver's perspective
-            spectator_transform = carla.Transform(spectator_location, vehicle_transform.rotation)
-            
-            spectator.set_transform(spectator_transform)
-
-    def render(self, display):
-        if self.camera_manager: self.camera_manager.render(display)
-        if self.hud: self.hud.render(display)
+    def on_sync_frame(self, frame_data):
+        """Handles the sensor data paired with one client-driven tick (synchronous mode only)."""
+        if self.camera_manager and frame_data['camera'] is not None:
+            CameraManager._parse_image(weakref.ref(self.camera_manager), frame_data['camera'])
+        if self.collision_sensor:
+            for event, arrived in frame_data['collision']:
+                CollisionSensor._on_collision(weakref.ref(self.collision_sensor), event, arrived)
+        if self.lane_invasion_sensor:
+            for event, arrived in frame_data['lane_invasion']:
+                LaneInvasionSensor._on_invasion(weakref.ref(self.lane_invasion_sensor), event, arrived)
+        if self.sensor_rig:
+            with self.hud.profiler.measure('sensor_rig'):
+                self.sensor_rig.collect(frame_data['snapshot'])
+
+    def tick(self, clock, frame_seconds=None):
+        with self.hud.profiler.measure('hud_tick'):
+            if self.player is not None:
+                self.state_cache.update(self.world, self.player)
+            self.hud.tick(self, clock)
+        if self.render_scale_controller is not None and self.camera_manager is not None:
+            # Synchronous mode passes the measured loop time: the server FPS is then just our own paced tick rate
+            if frame_seconds is None and self.hud.server_fps:
+                frame_seconds = 1.0 / self.hud.server_fps
+            new_scale = self.render_scale_controller.update(frame_seconds)
+            if new_scale is not None:
+                self.render_scale = new_scale
+                self.camera_manager.set_render_scale(new_scale)
+        if self.spectator_follower is not None and self.player is not None and isinstance(self.player, carla.Vehicle):
+            with self.hud.profiler.measure('spectator'):
+                self.spectator_follower.update(self.player)
+
+    def render(self, display, frame=None):
+        profiler = self.hud.profiler
+        if frame is not None:
+            # Render thread: draw only from the RenderFrame snapshot, the sim thread may be respawning sensors
+            with profiler.measure('camera_render'):
+                if frame.camera_surface is not None: blit_camera_surface(display, frame.camera_surface)
+            # The RenderThread releases frame.camera_surface back to its pool once this returns
+            with profiler.measure('hud_render'):
+                self.hud.render(display, frame.hud_state)
+            return
+        with profiler.measure('camera_render'):
+            if self.camera_manager: self.camera_manager.render(display)
+        with profiler.measure('hud_render'):
+            if self.hud: self.hud.render(display)
+
+    def render_frame(self):
+        """Snapshot of everything the compositor needs, handed to the RenderThread (which releases it)."""
+        pool = self.camera_manager.surfaces if self.camera_manager else None
+        return RenderFrame(
+            camera_surface=pool.checkout() if pool else None,
+            camera_pool=pool,
+            hud_state=self.hud.render_state())
 
     def destroy(self):
         sensors = [
-            self.camera_manager.sensor if self.camera_manager else None,
             self.collision_sensor.sensor if self.collision_sensor else None,
             self.lane_invasion_sensor.sensor if self.lane_invasion_sensor else None,
             self.gnss_sensor.sensor if self.gnss_sensor else None]
@@ -234,6 +667,13 @@ class World(object):
             if sensor is not None:
                 sensor.stop()
                 sensor.destroy()
+        if self.camera_manager is not None:
+            self.camera_manager.destroy_sensors()
+            self.camera_manager.stop_worker()
+            self.camera_manager.stop_recorder()
+        if self.sensor_rig is not None:
+            self.sensor_rig.destroy()
+            self.sensor_rig = None
         if self.player is not None:
             self.player.destroy()
             self.player = None # Important to nullify after destruction
@@ -245,6 +685,253 @@ class World(object):
         self.camera_manager = None
 
 
+# +------------------------------------------------------------------------------+
+# | ActorStateCache Class                                                        |
+# +------------------------------------------------------------------------------+
+class ActorStateCache(object):
+    """
+    Player state read once per tick from world.get_snapshot(), plus static physics data
+    (get_physics_control() is a heavy RPC) read once per vehicle. HUD.tick, the speeding check and
+    LaneInvasionSensor read from here instead of querying the player themselves.
+    The map (get_map() may transfer the whole OpenDRIVE file) is fetched once per session, and the
+    lane under the player is looked up at most once per tick, in `lane_index` once World has built it.
+    """
+    def __init__(self):
+        self.map = None
+        self.lane_index = None # LaneGeometryIndex of `map`, set by World when its background build finishes
+        # (frame, lane_index it came from or None for the map, waypoint or LaneMatch, unit 2D lane direction);
+        # keyed on the source too, as the index can be set mid-frame and asynchronous frames repeat
+        self._lane = (None, None, None, None)
+        self.frame = -1
+        self.actor_id = None
+        self.transform = None
+        self.velocity = None
+        self.speed_kmh = 0.0
+        self.control = None
+        self.max_rpm = 0.0
+        self._static = {} # actor id -> static physics values
+
+    def update(self, carla_world, player):
+        snapshot = carla_world.get_snapshot()
+        if snapshot.frame == self.frame and player.id == self.actor_id:
+            return
+        actor_snapshot = snapshot.find(player.id)
+        if actor_snapshot is not None:
+            transform, velocity = actor_snapshot.get_transform(), actor_snapshot.get_velocity()
+        else: # Actor spawned after this snapshot was taken
+            transform, velocity = player.get_transform(), player.get_velocity()
+        self.transform = transform
+        self.velocity = velocity
+        self.speed_kmh = 3.6 * math.sqrt(velocity.x**2 + velocity.y**2 + velocity.z**2)
+        self.control = player.get_control()
+        if player.id not in self._static:
+            self._static[player.id] = self._read_static(player)
+        self.max_rpm = self._static[player.id]['max_rpm']
+        self.actor_id = player.id
+        self.frame = snapshot.frame
+
+    def get_map(self, carla_world):
+        if self.map is None:
+            self.map = carla_world.get_map()
+        return self.map
+
+    def lane_waypoint(self, carla_world):
+        """
+        Lane at the cached transform and its unit XY direction, or (None, None): a LaneMatch from the
+        client-side lane index when it is built, otherwise the driving-lane waypoint from the map.
+        """
+        frame, transform, lane_index = self.frame, self.transform, self.lane_index
+        cached_frame, source, waypoint, direction = self._lane
+        if cached_frame == frame and source is lane_index:
+            return waypoint, direction
+        if lane_index is not None:
+            match = lane_index.match(transform.location)
+            self._lane = (frame, lane_index, match, (math.cos(match.heading), math.sin(match.heading)))
+            return self._lane[2:]
+        waypoint = self.get_map(carla_world).get_waypoint(transform.location, project_to_road=True,
+                                                          lane_type=carla.LaneType.Driving)
+        direction = None
+        if waypoint is not None:
+            forward = waypoint.transform.get_forward_vector()
+            length = math.hypot(forward.x, forward.y)
+            direction = (forward.x / length, forward.y / length) if length > 0 else (0.0, 0.0)
+        self._lane = (frame, None, waypoint, direction)
+        return waypoint, direction
+
+    @staticmethod
+    def _read_static(player):
+        max_rpm = 0.0
+        if isinstance(player, carla.Vehicle):
+            physics_control = player.get_physics_control()
+            max_rpm = getattr(physics_control, 'max_rpm', 0.0) if physics_control else 0.0
+        return {'max_rpm': max_rpm}
+
+
+# +------------------------------------------------------------------------------+
+# | LaneGeometryIndex Class                                                      |
+# +------------------------------------------------------------------------------+
+LaneMatch = collections.namedtuple('LaneMatch', [
+    'distance', 'heading', 'road_id', 'lane_id', 'lane_width', 'left_marking', 'right_marking', 'lateral_offset'])
+
+
+class LaneGeometryIndex(object):
+    """
+    Client-side nearest-lane lookup: a KD-tree over lane-center samples of Map.generate_waypoints(), with heading
+    (radians), road/lane ids, lane width and left/right marking types in NumPy arrays. Built once per map
+    (for_map), or offline from an OpenDRIVE file (from_xodr); queries never touch the server.
+    Samples are reordered so every tree node covers a contiguous slice; a leaf is searched in one NumPy call.
+    """
+    MARKING_TYPES = ('NONE', 'Other', 'Broken', 'Solid', 'SolidSolid', 'SolidBroken', 'BrokenSolid', 'BrokenBroken',
+                     'BottsDots', 'Grass', 'Curb')
+    _by_map = {}
+    _by_map_lock = threading.Lock()
+
+    def __init__(self, xyz, heading, road_id, lane_id, lane_width, left_marking, right_marking,
+                 leaf_size=LANE_INDEX_LEAF_SIZE):
+        xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        if len(xyz) == 0:
+            raise ValueError("no lane samples")
+        order = np.arange(len(xyz))
+        self._nodes = [] # (lo, hi, split dim or -1 for a leaf, split value, left node, right node)
+        self._build(xyz, order, 0, len(xyz), leaf_size)
+        self.xyz = np.ascontiguousarray(xyz[order])
+        self.heading = np.asarray(heading, dtype=np.float64)[order]
+        self.road_id = np.asarray(road_id, dtype=np.int32)[order]
+        self.lane_id = np.asarray(lane_id, dtype=np.int32)[order]
+        self.lane_width = np.asarray(lane_width, dtype=np.float32)[order]
+        self.left_marking = np.asarray(left_marking, dtype=np.uint8)[order]
+        self.right_marking = np.asarray(right_marking, dtype=np.uint8)[order]
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def _build(self, xyz, order, lo, hi, leaf_size):
+        node = len(self._nodes)
+        self._nodes.append(None)
+        if hi - lo <= leaf_size:
+            self._nodes[node] = (lo, hi, -1, 0.0, -1, -1)
+            return node
+        segment = order[lo:hi]
+        points = xyz[segment]
+        dim = int(np.argmax(points.max(axis=0) - points.min(axis=0))) # Split the widest extent
+        mid = (hi - lo) // 2
+        order[lo:hi] = segment[np.argpartition(points[:, dim], mid)]
+        split = float(xyz[order[lo + mid], dim])
+        left = self._build(xyz, order, lo, lo + mid, leaf_size)
+        right = self._build(xyz, order, lo + mid, hi, leaf_size)
+        self._nodes[node] = (lo, hi, dim, split, left, right)
+        return node
+
+    @classmethod
+    def from_map(cls, carla_map, spacing=LANE_INDEX_SPACING):
+        waypoints = [w for w in carla_map.generate_waypoints(spacing) if w.lane_type == carla.LaneType.Driving]
+        return cls(
+            [(w.transform.location.x, w.transform.location.y, w.transform.location.z) for w in waypoints],
+            [math.radians(w.transform.rotation.yaw) for w in waypoints],
+            [w.road_id for w in waypoints],
+            [w.lane_id for w in waypoints],
+            [w.lane_width for w in waypoints],
+            [cls._marking_code(w.left_lane_marking) for w in waypoints],
+            [cls._marking_code(w.right_lane_marking) for w in waypoints])
+
+    @classmethod
+    def from_xodr(cls, path, spacing=LANE_INDEX_SPACING):
+        """Builds the index from an OpenDRIVE file through carla.Map; no simulator needed."""
+        with open(path) as f:
+            carla_map = carla.Map(os.path.splitext(os.path.basename(path))[0], f.read())
+        return cls.from_map(carla_map, spacing)
+
+    @classmethod
+    def for_map(cls, carla_map, spacing=LANE_INDEX_SPACING):
+        """Index of `carla_map`, built on the first request for that map name and reused afterwards."""
+        key = (carla_map.name, spacing)
+        with cls._by_map_lock:
+            index = cls._by_map.get(key)
+            if index is None:
+                index = cls._by_map[key] = cls.from_map(carla_map, spacing)
+        return index
+
+    @classmethod
+    def _marking_code(cls, marking):
+        name = str(marking.type).split('.')[-1] if marking is not None else 'NONE'
+        return cls.MARKING_TYPES.index(name) if name in cls.MARKING_TYPES else cls.MARKING_TYPES.index('Other')
+
+    def nearest(self, x, y, z=0.0):
+        """Index and distance of the lane-center sample closest to (x, y, z)."""
+        query = (x, y, z)
+        xyz, nodes = self.xyz, self._nodes
+        best_i, best_d2 = -1, float('inf')
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if bound >= best_d2:
+                continue
+            lo, hi, dim, split, left, right = nodes[node]
+            if dim < 0:
+                d2 = np.square(xyz[lo:hi] - query).sum(axis=1)
+                i = int(d2.argmin())
+                if d2[i] < best_d2:
+                    best_i, best_d2 = lo + i, float(d2[i])
+                continue
+            diff = query[dim] - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, diff * diff)) # Visited only if the splitting plane is closer than the best so far
+            stack.append((near, bound))
+        return best_i, math.sqrt(best_d2)
+
+    def nearest_many(self, points):
+        """nearest() for an (N, 2) or (N, 3) array; returns (indices, distances) arrays."""
+        points = np.asarray(points, dtype=np.float64)
+        indices = np.empty(len(points), dtype=np.int64)
+        distances = np.empty(len(points), dtype=np.float64)
+        for n, point in enumerate(points.tolist()):
+            indices[n], distances[n] = self.nearest(*point)
+        return indices, distances
+
+    def match(self, location):
+        """LaneMatch for a carla.Location; lateral_offset is positive to the right of the lane direction."""
+        i, distance = self.nearest(location.x, location.y, location.z)
+        heading = float(self.heading[i])
+        dx, dy = location.x - float(self.xyz[i, 0]), location.y - float(self.xyz[i, 1])
+        return LaneMatch(
+            distance=distance, heading=heading, road_id=int(self.road_id[i]), lane_id=int(self.lane_id[i]),
+            lane_width=float(self.lane_width[i]),
+            left_marking=self.MARKING_TYPES[self.left_marking[i]],
+            right_marking=self.MARKING_TYPES[self.right_marking[i]],
+            lateral_offset=-math.sin(heading) * dx + math.cos(heading) * dy)
+
+
+# +------------------------------------------------------------------------------+
+# | SpectatorFollower Class                                                      |
+# +------------------------------------------------------------------------------+
+class SpectatorFollower(object):
+    """
+    Keeps the UE spectator in the driver seat. The spectator actor is looked up once, updates are
+    rate limited, and each update is a single fire-and-forget apply_batch command instead of the
+    get_spectator / set_transform round trips.
+    """
+    def __init__(self, client, carla_world, rate_hz=20.0):
+        self._client = client
+        self._spectator = carla_world.get_spectator()
+        self._period = 1.0 / rate_hz if rate_hz > 0 else 0.0 # 0 = update every tick
+        self._last_update = 0.0
+        self.driver_seat_offset_location = carla.Location(x=0.8, y=-0.4, z=1.3) # Adjusted for a more typical driver view
+
+    def update(self, player):
+        now = time.perf_counter()
+        if now - self._last_update < self._period:
+            return
+        self._last_update = now
+
+        # get_transform() reads the client's copy from the last tick, it does not call the server
+        vehicle_transform = player.get_transform()
+        # Apply the vehicle's rotation to the offset vector using transform_vector
+        rotated_offset = vehicle_transform.transform_vector(self.driver_seat_offset_location)
+        # The rotation is set to the vehicle's rotation to always look forward from the driver's perspective
+        spectator_transform = carla.Transform(vehicle_transform.location + rotated_offset, vehicle_transform.rotation)
+        self._client.apply_batch([carla.command.ApplyTransform(self._spectator.id, spectator_transform)])
+
+
 # +------------------------------------------------------------------------------+
 # | DualControl Class                                                            |
 # +------------------------------------------------------------------------------+
@@ -254,7 +941,7 @@ class DualControl(object):
         self._autopilot_enabled = start_in_autopilot
         if isinstance(world.player, carla.Vehicle):
             self._control = carla.VehicleControl()
-            world.player.set_autopilot(False) # Ensure autopilot is off initially for manual control
+            world.player.set_autopilot(self._autopilot_enabled) # Off for manual control, on for --autopilot (batch/headless runs)
         elif isinstance(world.player, carla.Walker):
             self._control = carla.WalkerControl()
             self._autopilot_enabled = False
@@ -361,6 +1048,8 @@ class DualControl(object):
                     world.restart()
                 elif event.key == K_F1:
                     world.hud.toggle_info()
+                elif event.key == K_F2:
+                    world.hud.profiler.toggle_overlay()
                 elif event.key == K_h or (event.key == K_SLASH and pygame.key.get_mods() & KMOD_SHIFT):
                     world.hud.help.toggle()
                 elif event.key == K_TAB:
@@ -410,8 +1099,6 @@ class DualControl(object):
                         self._control.hand_brake = not self._control.hand_brake 
                         world.hud.notification('Handbrake %s' % ('On' if self._control.hand_brake else 'Off'))
 
-                    if event.joy == self._steer_joystick_idx and event.button == 
-
                     if event.joy == self._steer_joystick_idx and event.button == self._reverse_button_idx:
                         player_velocity = world.player.get_velocity().length() if world.player else 0
                         if self._control.gear == -1: 
@@ -531,14 +1218,257 @@ class DualControl(object):
     def _is_quit_shortcut(key):
         return (key == K_ESCAPE) or (key == K_q and pygame.key.get_mods() & KMOD_CTRL)
 
+# +------------------------------------------------------------------------------+
+# | TextSurfaceCache Class                                                       |
+# +------------------------------------------------------------------------------+
+class TextSurfaceCache(object):
+    """
+    Rendered text surfaces in an LRU keyed by (string, font, color). Digit runs are drawn from a glyph atlas
+    per (font, color) instead, so readouts such as speed and RPM never render text or fill the cache as they change.
+    """
+    DIGITS = '0123456789'
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self._surfaces = collections.OrderedDict()
+        self._atlases = {}
+
+    def render(self, text, font, color):
+        key = (text, font, color)
+        surface = self._surfaces.get(key)
+        if surface is None:
+            surface = self._surfaces[key] = font.render(text, True, color)
+            if len(self._surfaces) > self.capacity:
+                self._surfaces.popitem(last=False)
+        else:
+            self._surfaces.move_to_end(key)
+        return surface
+
+    def _atlas(self, font, color):
+        # Each digit rendered once and packed side by side into one strip, with its area in the strip
+        key = (font, color)
+        atlas = self._atlases.get(key)
+        if atlas is None:
+            glyphs = [font.render(digit, True, color) for digit in self.DIGITS]
+            strip = pygame.Surface((sum(g.get_width() for g in glyphs), max(g.get_height() for g in glyphs)), pygame.SRCALPHA)
+            rects = []
+            x = 0
+            for glyph in glyphs:
+                strip.blit(glyph, (x, 0), special_flags=pygame.BLEND_RGBA_MAX) # Copies pixels and alpha unblended
+                rects.append(pygame.Rect(x, 0, glyph.get_width(), glyph.get_height()))
+                x += glyph.get_width()
+            atlas = self._atlases[key] = (strip, rects)
+        return atlas
+
+    def blit(self, target, text, font, color, pos, special_flags=0):
+        """Draws `text` at `pos`: digit runs glyph by glyph from the atlas, everything else as cached strings."""
+        x, y = pos
+        for n, part in enumerate(re.split(r'(\d+)', text)):
+            if not part:
+                continue
+            if n % 2: # re.split puts the captured digit runs at odd positions
+                strip, rects = self._atlas(font, color)
+                for digit in part:
+                    rect = rects[ord(digit) - 48]
+                    target.blit(strip, (x, y), rect, special_flags)
+                    x += rect.width
+            else:
+                surface = self.render(part, font, color)
+                target.blit(surface, (x, y), None, special_flags)
+                x += surface.get_width()
+        return x - pos[0]
+
+
+# +------------------------------------------------------------------------------+
+# | Alert Audio Class                                                            |
+# +------------------------------------------------------------------------------+
+class AlertAudio(object):
+    """
+    Alert sound playback with a small mixer buffer. Sounds are decoded on a background thread; an event whose
+    sound is not decoded yet is skipped. Critical events play on reserved channels and preempt a lower (or equally)
+    urgent sound already there, others take any free unreserved channel or are dropped. Each play records the
+    event-to-output latency (from the sensor callback receiving the event, plus one mixer buffer) in the profiler
+    as 'audio_latency'.
+    """
+    PRIORITIES = {"collision": 3, "oncoming_traffic_violation": 3, "error": 2}
+    CRITICAL_PRIORITY = 3
+    VOLUME = 0.5
+
+    @staticmethod
+    def pre_init(buffer_samples=AUDIO_BUFFER_SAMPLES):
+        # Must run before pygame.init(), which otherwise opens the device with pygame's default buffer
+        pygame.mixer.pre_init(AUDIO_FREQUENCY, -16, 2, buffer_samples)
+
+    def __init__(self, sound_files, profiler=None, buffer_samples=AUDIO_BUFFER_SAMPLES):
+        self.profiler = profiler
+        self.enabled = False
+        self.buffer_ms = 0.0
+        self.dropped = 0
+        self._sounds = {}
+        self._lock = threading.Lock()
+        self._playing = {} # Reserved channel index -> (priority, start time)
+        try:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init(AUDIO_FREQUENCY, -16, 2, buffer_samples)
+            frequency = pygame.mixer.get_init()[0]
+            pygame.mixer.set_num_channels(AUDIO_CHANNELS)
+            pygame.mixer.set_reserved(AUDIO_RESERVED_CHANNELS)
+        except pygame.error as e:
+            logging.warning(f"Audio disabled, could not open the mixer: {e}")
+            self._loader = None
+            return
+        self.enabled = True
+        self.buffer_ms = 1000.0 * buffer_samples / frequency
+        self._reserved = [pygame.mixer.Channel(i) for i in range(AUDIO_RESERVED_CHANNELS)]
+        # set_reserved() only keeps Sound.play() off the reserved channels; find_channel() would still return them
+        self._shared = [pygame.mixer.Channel(i) for i in range(AUDIO_RESERVED_CHANNELS, AUDIO_CHANNELS)]
+        logging.info(f"Audio: {frequency} Hz, {buffer_samples}-sample buffer ({self.buffer_ms:.1f} ms), "
+                     f"{AUDIO_RESERVED_CHANNELS} of {AUDIO_CHANNELS} channels reserved for critical alerts")
+        self._loader = threading.Thread(target=self._load, args=(dict(sound_files),), name='AlertAudioLoader', daemon=True)
+        self._loader.start()
+
+    def _load(self, sound_files):
+        decoded = {} # Several events share a file
+        for sound_type, filename in sound_files.items():
+            if filename not in decoded:
+                sound = None
+                try:
+                    if os.path.exists(filename):
+                        sound = pygame.mixer.Sound(filename)
+                        sound.set_volume(self.VOLUME)
+                    else:
+                        print(f"Warning: Sound file '{filename}' for type '{sound_type}' not found. This sound will be disabled.")
+                except pygame.error as e:
+                    print(f"Warning: Could not load sound '{filename}' for type '{sound_type}': {e}")
+                decoded[filename] = sound
+            self._sounds[sound_type] = decoded[filename]
+
+    def wait_loaded(self, timeout=None):
+        if self._loader is not None:
+            self._loader.join(timeout)
+
+    def has_sound(self, sound_type):
+        return self._sounds.get(sound_type) is not None
+
+    def play(self, sound_type, event_time=None):
+        """Plays `sound_type` now; `event_time` (time.perf_counter()) is when the triggering event happened."""
+        sound = self._sounds.get(sound_type)
+        if sound is None:
+            return False
+        event_time = time.perf_counter() if event_time is None else event_time
+        priority = self.PRIORITIES.get(sound_type, 1)
+        with self._lock:
+            if priority >= self.CRITICAL_PRIORITY:
+                channel = self._reserved_channel(priority)
+            else:
+                channel = next((c for c in self._shared if not c.get_busy()), None) # Never steals
+            if channel is None:
+                self.dropped += 1
+                return False
+            channel.play(sound)
+        if self.profiler is not None:
+            self.profiler.record('audio_latency', time.perf_counter() - event_time + self.buffer_ms / 1000.0)
+        return True
+
+    def _reserved_channel(self, priority):
+        now = time.perf_counter()
+        victim = None
+        for index, channel in enumerate(self._reserved):
+            if not channel.get_busy():
+                self._playing[index] = (priority, now)
+                return channel
+            playing = self._playing.get(index, (0, 0.0))
+            # Preempt the least urgent sound, the oldest one among equals
+            if playing[0] <= priority and (victim is None or playing < self._playing.get(victim, (0, 0.0))):
+                victim = index
+        if victim is None:
+            return None
+        self._reserved[victim].stop()
+        self._playing[victim] = (priority, now)
+        return self._reserved[victim]
+
+    def latency_ms(self):
+        """Median event-to-output latency so far, or the mixer buffer alone before anything played."""
+        try:
+            p = self.profiler.percentiles('audio_latency', (50,))
+        except AttributeError: # No profiler
+            p = None
+        return self.buffer_ms if p is None else float(p[0])
+
+
+# +------------------------------------------------------------------------------+
+# | HUD Compositor Classes                                                       |
+# +------------------------------------------------------------------------------+
+class HUDLayer(object):
+    """
+    One layer of the HUD. A cached layer keeps `surface` at `pos` between frames and is redrawn by
+    draw(layer) only after mark_dirty(), at most refresh_hz times a second (0 = on the next composite).
+    An immediate layer is drawn straight onto the display by draw(display) on every composite.
+    """
+    def __init__(self, name, draw, refresh_hz=0.0, immediate=False, visible=True):
+        self.name = name
+        self.draw = draw
+        self.refresh_hz = refresh_hz
+        self.immediate = immediate
+        self.visible = visible
+        self.surface = None
+        self.pos = (0, 0)
+        self.dirty = True
+        self.redraws = 0
+        self._last_draw = None
+
+    def mark_dirty(self):
+        self.dirty = True
+
+
+class LayerCompositor(object):
+    """Blits the HUD layers bottom to top, redrawing a cached layer only when it is dirty and due."""
+    def __init__(self):
+        self.layers = collections.OrderedDict()
+
+    def add(self, layer):
+        self.layers[layer.name] = layer
+        return layer
+
+    def __getitem__(self, name):
+        return self.layers[name]
+
+    def composite(self, display, now=None):
+        now = time.perf_counter() if now is None else now
+        for layer in self.layers.values():
+            if not layer.visible:
+                continue
+            if layer.immediate:
+                layer.draw(display)
+                continue
+            if layer.dirty and (layer._last_draw is None or not layer.refresh_hz or
+                                now - layer._last_draw >= 1.0 / layer.refresh_hz):
+                layer.draw(layer)
+                layer.dirty = False
+                layer.redraws += 1
+                layer._last_draw = now
+            if layer.surface is not None:
+                display.blit(layer.surface, layer.pos)
+
+
 # +------------------------------------------------------------------------------+
 # | HUD Class (MODIFIED)                                                         |
 # +------------------------------------------------------------------------------+
 
+# What HUD.render() draws, captured on the sim thread. For the render thread the notification surfaces are copies
+# with the alpha they had at capture, since BlinkingAlert.tick() keeps changing alpha and position meanwhile.
+NotificationSprite = collections.namedtuple('NotificationSprite', ['text', 'surface', 'alpha', 'pos'])
+HUDState = collections.namedtuple('HUDState', ['info_text', 'notifications', 'show_help', 'warning_surface'])
+
+
 class HUD(object):
+    INFO_REFRESH_HZ = 15.0 # Info panel text; the camera and notifications still update every frame
+    PROFILER_REFRESH_HZ = 4.0
+
     def __init__(self, width, height, args): # Added args to __init__
         self.dim = (width, height)
-        self._notification_font = pygame.font.Font(pygame.font.get_default_font(), 20)
+        self.headless = getattr(args, 'headless', False) # ADDED: No compositor; notifications are logged instead of drawn
+        self._notification_font = load_font(pygame.font.get_default_font(), 20)
 
         # Custom Font Path (relative to script execution, assuming carla_root is the base)
         self.custom_notification_font_path = os.path.join(args.carla_root, 'CarlaUE4', 'Content', 'Carla', 'Fonts', 'RaceHead.ttf') # Corrected font path and name
@@ -562,16 +1492,28 @@ class HUD(object):
         secondary_font_names = ['ubuntumono', 'consolas', 'courier', 'mono']
 
         chosen_primary_font_name = self._find_font(primary_font_names, bold=True)
-        self._font_primary_hud = pygame.font.Font(chosen_primary_font_name, primary_font_size)
+        self._font_primary_hud = load_font(chosen_primary_font_name, primary_font_size)
         
         chosen_secondary_font_name = self._find_font(secondary_font_names, bold=True)
-        self._font_secondary_hud = pygame.font.Font(chosen_secondary_font_name, secondary_font_size)
+        self._font_secondary_hud = load_font(chosen_secondary_font_name, secondary_font_size)
         
-        self._font_score_hud = pygame.font.Font(self._find_font(primary_font_names, bold=True), score_font_size) 
+        self._font_score_hud = load_font(chosen_primary_font_name, score_font_size) 
+
+        # ADDED: Notification fonts are resolved once and preloaded, so an alert never opens a font file
+        if self._use_custom_notification_font:
+            self._notification_text_font_path = self.custom_notification_font_path
+            self._notification_symbol_font_path = self.custom_notification_font_path
+        else:
+            self._notification_text_font_path = self._find_font(['ubuntumono', 'arial', 'sans'], bold=True)
+            self._notification_symbol_font_path = pygame.font.get_default_font()
+        for font_size, symbol_size in ((36, 42), (48, 56)): # Regular and critical-center notifications
+            load_font(self._notification_text_font_path, font_size)
+            load_font(self._notification_symbol_font_path, symbol_size)
+
+        # ADDED: Per-phase frame profiler (F2 overlay, CSV export at shutdown); also receives the audio latency
+        self.profiler = FrameProfiler()
 
         # MODIFIED: Sound Management
-        pygame.mixer.init() 
-        self.sounds = {}
         self.sound_cooldowns = {
             "lane_drift": 3.0, # Crossing broken lines
             "solid_line_crossing": 2.0, # Crossing solid line, same direction
@@ -596,28 +1538,32 @@ class HUD(object):
             "default_notification": "./audio/alerts/alert_sound.wav"
         }
 
-        for sound_type, filename in sound_files.items():
-            try:
-                if os.path.exists(filename):
-                    self.sounds[sound_type] = pygame.mixer.Sound(filename)
-                    self.sounds[sound_type].set_volume(0.5) 
-                else:
-                    print(f"Warning: Sound file '{filename}' for type '{sound_type}' not found. This sound will be disabled.")
-                    self.sounds[sound_type] = None
-            except pygame.error as e:
-                print(f"Warning: Could not load sound '{filename}' for type '{sound_type}': {e}")
-                self.sounds[sound_type] = None
+        # ADDED: Decoded in the background on a small-buffer mixer; critical events get reserved channels
+        self.audio = AlertAudio(sound_files, self.profiler, getattr(args, 'audio_buffer', AUDIO_BUFFER_SAMPLES))
         # End Sound Management Modification
 
         self._persistent_warning = PersistentWarning(self._font_secondary_hud, self.dim, (0,0)) 
 
-        self.help = HelpText(pygame.font.Font(chosen_secondary_font_name, 24), width, height)
+        self.help = HelpText(load_font(chosen_secondary_font_name, 24), width, height)
         self.server_fps = 0
         self.frame = 0
         self.simulation_time = 0
         self._show_info = True
         self._info_text = []
         self._server_clock = pygame.time.Clock()
+        self._text_cache = TextSurfaceCache()
+        self._info_panel_lines = None # Lines the info layer was last drawn with
+        self._pending_info_text = []
+        self._frame_state = None # HUDState being drawn by render()
+        # ADDED: Layered compositor. Static layers are drawn once, the info text and profiler overlay only when
+        # their content changed and at a reduced rate; notifications animate and are drawn every frame.
+        self._compositor = LayerCompositor()
+        self._compositor.add(HUDLayer('panel', self._draw_panel_layer))
+        self._compositor.add(HUDLayer('info', self._draw_info_layer, refresh_hz=self.INFO_REFRESH_HZ))
+        self._compositor.add(HUDLayer('notifications', self._draw_notifications, immediate=True))
+        self._compositor.add(HUDLayer('help', self._draw_help_layer))
+        self._compositor.add(HUDLayer('warning', self._draw_warning_layer))
+        self._compositor.add(HUDLayer('profiler', self._draw_profiler_layer, refresh_hz=self.PROFILER_REFRESH_HZ))
 
         self._active_notifications = [] 
         # MODIFIED: Stacked notifications now start near the bottom and stack upwards
@@ -631,6 +1577,11 @@ class HUD(object):
         self.reset_warning_trackers()
 
     def _find_font(self, font_names_list, bold=False):
+        # MODIFIED: Resolved through the on-disk cache; the system font scan runs only on a cold or stale entry
+        return FONT_PATH_CACHE.resolve(list(font_names_list), bold, self._scan_font)
+
+    @staticmethod
+    def _scan_font(font_names_list, bold=False):
         chosen_font_name = None
         for name in font_names_list:
             matched_font = pygame.font.match_font(name, bold=bold)
@@ -669,22 +1620,24 @@ class HUD(object):
         self.frame = timestamp.frame
         self.simulation_time = timestamp.elapsed_seconds
 
-    def play_sound_for_event(self, event_type, force_play=False):
-        sound_to_play = self.sounds.get(event_type)
-        if not sound_to_play:
-            sound_to_play = self.sounds.get("default_notification") 
-            if not sound_to_play:
+    def play_sound_for_event(self, event_type, force_play=False, event_time=None):
+        # event_time: time.perf_counter() when the sensor event arrived, for AlertAudio's latency record
+        sound_type = event_type
+        if not self.audio.has_sound(sound_type):
+            sound_type = "default_notification" 
+            if not self.audio.has_sound(sound_type):
                 return 
 
         current_time = time.time()
         cooldown = self.sound_cooldowns.get(event_type, 0.0) 
 
         if force_play or current_time > self._last_sound_time.get(event_type, 0.0) + cooldown:
-            sound_to_play.play()
-            self._last_sound_time[event_type] = current_time
+            # MODIFIED: Played through AlertAudio, which picks/preempts the channel and records the latency
+            if self.audio.play(sound_type, event_time):
+                self._last_sound_time[event_type] = current_time
 
 
-    def deduct_score(self, points, violation_type="unknown"):
+    def deduct_score(self, points, violation_type="unknown", event_time=None):
         self.current_score -= points
         if self.current_score < 0: self.current_score = 0 
         
@@ -728,7 +1681,7 @@ class HUD(object):
                           symbol_enabled=True, symbol_color=symbol_color, 
                           is_blinking=is_critical, is_critical_center=is_critical)
 
-        self.play_sound_for_event(sound_event_type, force_play=is_critical)
+        self.play_sound_for_event(sound_event_type, force_play=is_critical, event_time=event_time)
 
 
     def tick(self, world, clock):
@@ -747,21 +1700,21 @@ class HUD(object):
             self._info_text = [("Player not ready", "secondary")]
             return
 
-        v = world.player.get_velocity()
-        c = world.player.get_control()
-        
-        speed_kmh = 3.6 * math.sqrt(v.x**2 + v.y**2 + v.z**2)
+        # MODIFIED: Read from the per-tick state cache instead of three player RPCs per frame
+        state = world.state_cache
+        c = state.control
+        speed_kmh = state.speed_kmh
+        max_rpm = state.max_rpm
 
-        physics_control = world.player.get_physics_control()
         current_rpm = 0
-        if isinstance(c, carla.VehicleControl) and physics_control and hasattr(physics_control, 'max_rpm') and physics_control.max_rpm > 0:
+        if isinstance(c, carla.VehicleControl) and max_rpm > 0:
             if c.throttle > 0.01: 
-                current_rpm = int(c.throttle * physics_control.max_rpm * 0.8 + 1000) 
+                current_rpm = int(c.throttle * max_rpm * 0.8 + 1000) 
             elif speed_kmh > 1.0: 
-                current_rpm = int((speed_kmh / 100.0) * (physics_control.max_rpm / 3.0) + 800) 
+                current_rpm = int((speed_kmh / 100.0) * (max_rpm / 3.0) + 800) 
             else: 
                 current_rpm = 800 
-            current_rpm = min(current_rpm, int(physics_control.max_rpm))
+            current_rpm = min(current_rpm, int(max_rpm))
             current_rpm = max(800, current_rpm) 
         
         gear_display = "N/A"
@@ -777,6 +1730,12 @@ class HUD(object):
             ('', 'spacer_large'), 
         ]
 
+        # ADDED: Lateral offset from the lane center, from the client-side lane index (no server round trip)
+        if state.lane_index is not None and state.transform is not None:
+            lane, _ = state.lane_waypoint(world.world)
+            if isinstance(lane, LaneMatch):
+                self._info_text.insert(-1, ('LANE OFFSET: %+.2f M' % lane.lateral_offset, 'primary'))
+
         self._info_text.append(('Collision Penalty: -%d' % self.total_points_lost_collisions, 'penalty_label'))
         self._info_text.append(('Lane Violation Penalty: -%d' % self.total_points_lost_lane_violations, 'penalty_label'))
         
@@ -806,20 +1765,19 @@ class HUD(object):
                      symbol_enabled=False, symbol_color=(255, 0, 0), 
                      is_blinking=False, is_critical_center=False): 
         
+        if self.headless:
+            logging.info(f"HUD [frame {self.frame}]: {text}")
+            return
+
         font_size = 48 if is_critical_center else 36 
         symbol_size = 56 if is_critical_center else 42
 
-        # Use custom font if available, otherwise fallback
-        if self._use_custom_notification_font:
-            notification_text_font = pygame.font.Font(self.custom_notification_font_path, font_size)
-            # It's generally safer to use a font known to have symbols for warning icons.
-            # If Aeromovedemo.ttf does not contain the '⚠' symbol, it might appear blank or as an unknown character.
-            # If you encounter missing symbols, consider changing this line to:
-            # notification_symbol_font = pygame.font.Font(pygame.font.get_default_font(), symbol_size)
-            notification_symbol_font = pygame.font.Font(self.custom_notification_font_path, symbol_size) 
-        else:
-            notification_text_font = pygame.font.Font(self._find_font(['ubuntumono', 'arial', 'sans'], bold=True), font_size) 
-            notification_symbol_font = pygame.font.Font(pygame.font.get_default_font(), symbol_size) 
+        # Custom font if available, otherwise fallback (paths resolved in __init__, fonts come from the cache)
+        # It's generally safer to use a font known to have symbols for warning icons.
+        # If the custom font does not contain the '⚠' symbol, it might appear blank or as an unknown character.
+        # If you encounter missing symbols, set _notification_symbol_font_path to pygame.font.get_default_font().
+        notification_text_font = load_font(self._notification_text_font_path, font_size)
+        notification_symbol_font = load_font(self._notification_symbol_font_path, symbol_size) 
 
         notif_width = self.dim[0] * 0.5 if is_critical_center else 400 
         notif_height = 70 if is_critical_center else 50 
@@ -852,71 +1810,147 @@ class HUD(object):
         self.play_sound_for_event("error", force_play=True) 
 
 
-    def render(self, display):
-        if self._show_info and self._info_text:
-            hud_panel_width = 350 
-            info_surface = pygame.Surface((hud_panel_width, self.dim[1]), pygame.SRCALPHA) 
-            info_surface.fill((0, 0, 0, 100)) 
-            display.blit(info_surface, (0, 0)) 
-            
-            v_offset = 10 
-            line_padding = 5 
-
-            for item_text, item_type_key in self._info_text:
-                if v_offset > self.dim[1] - 20: break 
-
-                font_to_use = self._font_primary_hud
-                text_color_to_use = (255, 255, 255) 
-                
-                if item_type_key == 'secondary':
-                    font_to_use = self._font_secondary_hud
-                elif item_type_key == 'score_display':
-                    font_to_use = self._font_score_hud 
-                    text_color_to_use = (255, 255, 0) 
-                elif item_type_key == 'penalty_label':
-                    font_to_use = self._font_secondary_hud 
-                    text_color_to_use = (255, 100, 100) 
-                elif item_type_key == 'spacer_small':
-                    v_offset += self._font_secondary_hud.get_linesize() // 3
-                    continue
-                elif item_type_key == 'spacer_large':
-                    v_offset += self._font_secondary_hud.get_linesize() // 2
-                    continue
-                
-                text_surface = font_to_use.render(item_text, True, text_color_to_use)
-                display.blit(text_surface, (10, v_offset)) 
-                v_offset += font_to_use.get_linesize() + line_padding
-        
+    def render_state(self, copy_surfaces=True):
+        """
+        HUDState snapshot for render(). With copy_surfaces the result shares no mutable object with the
+        sim thread (the render thread's case); without, notification surfaces are the live ones.
+        """
+        warning = self._persistent_warning
+        return HUDState(
+            info_text=list(self._info_text),
+            notifications=self._notification_sprites(self._active_notifications, copy_surfaces),
+            show_help=bool(self.help and self.help._render),
+            warning_surface=warning.text_surface if warning and warning.is_active else None)
+
+    def _notification_sprites(self, notifications, copy_surfaces):
+        sprites = []
         # MODIFIED START: Reverted notification stacking logic to stack upwards from bottom
         current_stacked_y_offset = self._notification_base_pos_y 
         
-        for notif_obj in reversed(self._active_notifications): 
-            if notif_obj.surface.get_alpha() == 0 and notif_obj.seconds_left <=0: continue 
+        for notif_obj in reversed(notifications): 
+            surface = notif_obj.surface
+            alpha = surface.get_alpha()
+            alpha = 255 if alpha is None else alpha
+            if alpha == 0 and notif_obj.seconds_left <=0: continue 
 
             if notif_obj.is_critical_center:
-                notif_obj.render(display) 
+                if alpha == 0: continue
+                pos = (notif_obj.current_pos[0], notif_obj.current_pos[1])
             else:
-                notif_x = (self.dim[0] - notif_obj.surface.get_width()) // 2 
+                notif_x = (self.dim[0] - surface.get_width()) // 2 
                 # Calculate y position for stacking upwards
-                notif_y = current_stacked_y_offset - notif_obj.surface.get_height()
+                notif_y = current_stacked_y_offset - surface.get_height()
                 
                 # Stop rendering if notifications go too high (e.g., above 15% from top)
                 if notif_y < self.dim[1] * 0.15 : break 
                 
-                display.blit(notif_obj.surface, (notif_x, notif_y))
+                pos = (notif_x, notif_y)
                 # Move the offset upwards for the next notification
-                current_stacked_y_offset -= (notif_obj.surface.get_height() + self._notification_spacing)
+                current_stacked_y_offset -= (surface.get_height() + self._notification_spacing)
+            if copy_surfaces:
+                surface = surface.copy()
+                surface.set_alpha(alpha)
+            sprites.append(NotificationSprite(notif_obj.text, surface, alpha, pos))
         # MODIFIED END
-
-        if self.help : self.help.render(display)
-        
-        if self._persistent_warning: self._persistent_warning.render(display)
+        return tuple(sprites)
+
+    def render(self, display, state=None):
+        # MODIFIED: Draws a HUDState; the render thread passes the one captured with its RenderFrame
+        state = self.render_state(copy_surfaces=False) if state is None else state
+        info_text = state.info_text
+        layers = self._compositor
+        self._frame_state = state
+        info_visible = bool(self._show_info and info_text)
+        layers['panel'].visible = layers['info'].visible = info_visible
+        if info_visible and info_text != self._info_panel_lines:
+            self._pending_info_text = info_text
+            layers['info'].mark_dirty()
+        layers['help'].visible = state.show_help
+        layers['warning'].visible = state.warning_surface is not None
+        if layers['warning'].visible and layers['warning'].surface is not state.warning_surface:
+            layers['warning'].mark_dirty()
+        layers['profiler'].visible = self.profiler.show_overlay
+        layers['profiler'].mark_dirty() # Percentiles move every frame; the layer's refresh_hz paces the redraws
+        layers.composite(display)
+
+    def _draw_panel_layer(self, layer):
+        layer.surface = pygame.Surface((350, self.dim[1]), pygame.SRCALPHA)
+        layer.surface.fill((0, 0, 0, 100))
+
+    def _draw_info_layer(self, layer):
+        info_text = self._pending_info_text
+        v_offset = 10 
+        line_padding = 5 
+        lines = []
+
+        for item_text, item_type_key in info_text:
+            if v_offset > self.dim[1] - 20: break 
+
+            font_to_use = self._font_primary_hud
+            text_color_to_use = (255, 255, 255) 
+            
+            if item_type_key == 'secondary':
+                font_to_use = self._font_secondary_hud
+            elif item_type_key == 'score_display':
+                font_to_use = self._font_score_hud 
+                text_color_to_use = (255, 255, 0) 
+            elif item_type_key == 'penalty_label':
+                font_to_use = self._font_secondary_hud 
+                text_color_to_use = (255, 100, 100) 
+            elif item_type_key == 'spacer_small':
+                v_offset += self._font_secondary_hud.get_linesize() // 3
+                continue
+            elif item_type_key == 'spacer_large':
+                v_offset += self._font_secondary_hud.get_linesize() // 2
+                continue
+            
+            lines.append((item_text, font_to_use, text_color_to_use, v_offset))
+            v_offset += font_to_use.get_linesize() + line_padding
+
+        # Transparent layer only as tall as the text, over the static panel layer
+        size = (350, max(1, v_offset))
+        if layer.surface is None or layer.surface.get_size() != size:
+            layer.surface = pygame.Surface(size, pygame.SRCALPHA)
+        layer.surface.fill((0, 0, 0, 0))
+        for item_text, font_to_use, text_color_to_use, y in lines:
+            # Lines never overlap, so the glyphs are copied onto the cleared layer rather than blended
+            self._text_cache.blit(layer.surface, item_text, font_to_use, text_color_to_use, (10, y),
+                                  special_flags=pygame.BLEND_RGBA_MAX)
+        self._info_panel_lines = list(info_text)
+
+    def _draw_notifications(self, display):
+        for sprite in self._frame_state.notifications:
+            display.blit(sprite.surface, sprite.pos)
+
+    def _draw_help_layer(self, layer):
+        layer.surface, layer.pos = self.help.surface, self.help.pos
+
+    def _draw_warning_layer(self, layer):
+        layer.surface = self._frame_state.warning_surface
+        layer.pos = (self.dim[0] - layer.surface.get_width() - 10, 10)
+
+    def _draw_profiler_layer(self, layer):
+        lines = self.profiler.overlay_lines()
+        line_height = self._font_secondary_hud.get_linesize()
+        panel_width = max(self._font_secondary_hud.size(line)[0] for line in lines) + 20
+        size = (panel_width, line_height * len(lines) + 20)
+        if layer.surface is None or layer.surface.get_size() != size:
+            layer.surface = pygame.Surface(size, pygame.SRCALPHA)
+        layer.surface.fill((0, 0, 0, 180))
+        for n, line in enumerate(lines):
+            self._text_cache.blit(layer.surface, line, self._font_secondary_hud, (0, 255, 128), (10, 10 + n * line_height))
+        layer.pos = (self.dim[0] - panel_width - 10, 60)
 
 
 # +------------------------------------------------------------------------------+
 # | BlinkingAlert Class (MODIFIED from FadingText)                               |
 # +------------------------------------------------------------------------------+
 class BlinkingAlert(object):
+    TEXTURE_CACHE_SIZE = 64
+    _textures = collections.OrderedDict() # ADDED: Finished alert surfaces shared by all alerts (LRU), see set_text
+    _texture_lock = threading.Lock() # Notifications are raised from sensor callback threads too
+    _gradient_strip = None
+
     def __init__(self, font, screen_dim, initial_dim, symbol_font=None):
         self.font = font
         self.screen_dim = screen_dim 
@@ -933,7 +1967,7 @@ class BlinkingAlert(object):
         self.is_blinking = False
         self.is_critical_center = False 
 
-        self.symbol_font = symbol_font if symbol_font else pygame.font.Font(pygame.font.get_default_font(), int(self.initial_dim[1] * 0.7))
+        self.symbol_font = symbol_font if symbol_font else load_font(pygame.font.get_default_font(), int(self.initial_dim[1] * 0.7))
 
         self.bounce_height = 30.0 
         self.bounce_frequency = 2.5 
@@ -958,17 +1992,57 @@ class BlinkingAlert(object):
         self.is_critical_center = is_critical_center
         self.vertical_bar_color = symbol_color 
 
+        display_text_str = text.upper() if self.is_critical_center or self.is_blinking else text
+
+        # MODIFIED: The finished alert is rendered once per look and cached; repeated alerts only copy it
+        key = (display_text_str, tuple(text_color), symbol_enabled, tuple(symbol_color), self.font, self.symbol_font,
+               is_critical_center, tuple(self.initial_dim))
+        with BlinkingAlert._texture_lock:
+            texture = BlinkingAlert._textures.get(key)
+            if texture is not None:
+                BlinkingAlert._textures.move_to_end(key)
+        if texture is None:
+            texture = self._render_texture(display_text_str, text_color, symbol_enabled, symbol_color)
+            with BlinkingAlert._texture_lock:
+                BlinkingAlert._textures[key] = texture
+                while len(BlinkingAlert._textures) > BlinkingAlert.TEXTURE_CACHE_SIZE:
+                    BlinkingAlert._textures.popitem(last=False)
+        self.surface = texture.copy() # Each alert fades its own copy with set_alpha()
+        box_width, box_height = self.surface.get_size()
+
+        if self.is_critical_center:
+            target_center_y = int(self.screen_dim[1] * 0.40) 
+            self.initial_pos = [(self.screen_dim[0] - box_width) // 2, target_center_y - box_height // 2]
+        else:
+            # For non-critical, notifications start off-screen at the bottom and fade in/move up
+            self.initial_pos = [(self.screen_dim[0] - box_width) // 2, self.screen_dim[1]] 
+        self.current_pos = list(self.initial_pos)
+
+    @classmethod
+    def _gradient(cls, width, height):
+        # One 256-column alpha ramp (10% to 220 alpha, black), scaled to each alert's gradient area
+        if cls._gradient_strip is None:
+            strip = pygame.Surface((256, 1), pygame.SRCALPHA)
+            alpha_left, alpha_right = int(255 * 0.1), 220
+            for x_col in range(256):
+                strip.set_at((x_col, 0), (0, 0, 0, int(alpha_left + (alpha_right - alpha_left) * x_col / 255)))
+            cls._gradient_strip = strip
+        return pygame.transform.scale(cls._gradient_strip, (width, height))
+
+    def _outline(self, texture):
+        # Stroke of outline_thickness around the glyphs: their mask dilated by a square kernel, drawn in one blit
+        # at (-outline_thickness, -outline_thickness) relative to the texture
+        size = 2 * self.outline_thickness + 1
+        stroke = pygame.mask.from_surface(texture).convolve(pygame.mask.Mask((size, size), fill=True))
+        return stroke.to_surface(setcolor=self.outline_color + (255,), unsetcolor=(0, 0, 0, 0))
+
+    def _render_texture(self, display_text_str, text_color, symbol_enabled, symbol_color):
         symbol_texture_main = None
-        symbol_texture_outline = None
         if symbol_enabled:
             symbol_text_str = "⚠" 
             symbol_texture_main = self.symbol_font.render(symbol_text_str, True, symbol_color)
-            symbol_texture_outline = self.symbol_font.render(symbol_text_str, True, self.outline_color)
-
 
-        display_text_str = text.upper() if self.is_critical_center or self.is_blinking else text
         text_texture_main = self.font.render(display_text_str, True, text_color)
-        text_texture_outline = self.font.render(display_text_str, True, self.outline_color)
 
         padding_horizontal = 20 if self.is_critical_center else 15
         padding_vertical = 15 if self.is_critical_center else 10
@@ -986,65 +2060,30 @@ class BlinkingAlert(object):
             box_width = max(box_width, self.initial_dim[0]) 
             box_height = max(box_height, self.initial_dim[1])
 
-
-        self.surface = pygame.Surface((box_width, box_height), pygame.SRCALPHA)
+        surface = pygame.Surface((box_width, box_height), pygame.SRCALPHA)
         
         # --- Draw Gradient Background ---
-        base_rgb = (0, 0, 0) 
         gradient_area_width = box_width - self.vertical_bar_width - (padding_horizontal // 3) # Area to the left of the bar
-        
-        alpha_left = int(255 * 0.1) 
-        alpha_right = 220           
-        
-        for x_col in range(gradient_area_width):
-            ratio = x_col / (gradient_area_width -1) if gradient_area_width > 1 else 0
-            current_alpha = int(alpha_left + (alpha_right - alpha_left) * ratio)
-            current_alpha = max(0, min(255, current_alpha)) 
-            line_color = (base_rgb[0], base_rgb[1], base_rgb[2], current_alpha)
-            pygame.draw.line(self.surface, line_color, (x_col, 0), (x_col, box_height))
+        if gradient_area_width > 0:
+            surface.blit(self._gradient(gradient_area_width, box_height), (0, 0))
 
         bar_x = gradient_area_width 
         bar_rect = pygame.Rect(bar_x, 0, self.vertical_bar_width, box_height) 
-        pygame.draw.rect(self.surface, self.vertical_bar_color, bar_rect) 
-
-        blit_x_start_content = padding_horizontal 
-        current_blit_x_main = blit_x_start_content
+        pygame.draw.rect(surface, self.vertical_bar_color, bar_rect) 
 
+        current_blit_x_main = padding_horizontal 
         symbol_y_main = (box_height - (symbol_texture_main.get_height() if symbol_texture_main else 0)) // 2
         text_y_main = (box_height - text_texture_main.get_height()) // 2
-        
-        offsets = []
-        for dx_outline in range(-self.outline_thickness, self.outline_thickness + 1):
-            for dy_outline in range(-self.outline_thickness, self.outline_thickness + 1):
-                if not (dx_outline == 0 and dy_outline == 0): # All points in a square around center
-                     offsets.append((dx_outline, dy_outline))
-        
-        if not offsets and self.outline_thickness > 0: 
-             offsets = [(-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1)]
-
-
-        temp_blit_x_outline = blit_x_start_content
-        if symbol_texture_outline:
-            for dx, dy in offsets:
-                self.surface.blit(symbol_texture_outline, (temp_blit_x_outline + dx, symbol_y_main + dy))
-            temp_blit_x_outline += symbol_texture_outline.get_width() + (padding_horizontal // 2)
-            
-        for dx, dy in offsets:
-             self.surface.blit(text_texture_outline, (temp_blit_x_outline + dx, text_y_main + dy))
+        t = self.outline_thickness
 
         if symbol_texture_main:
-            self.surface.blit(symbol_texture_main, (current_blit_x_main, symbol_y_main))
+            surface.blit(self._outline(symbol_texture_main), (current_blit_x_main - t, symbol_y_main - t))
+            surface.blit(symbol_texture_main, (current_blit_x_main, symbol_y_main))
             current_blit_x_main += symbol_texture_main.get_width() + (padding_horizontal // 2)
         
-        self.surface.blit(text_texture_main, (current_blit_x_main, text_y_main))
-
-        if self.is_critical_center:
-            target_center_y = int(self.screen_dim[1] * 0.40) 
-            self.initial_pos = [(self.screen_dim[0] - box_width) // 2, target_center_y - box_height // 2]
-        else:
-            # For non-critical, notifications start off-screen at the bottom and fade in/move up
-            self.initial_pos = [(self.screen_dim[0] - box_width) // 2, self.screen_dim[1]] 
-        self.current_pos = list(self.initial_pos)
+        surface.blit(self._outline(text_texture_main), (current_blit_x_main - t, text_y_main - t))
+        surface.blit(text_texture_main, (current_blit_x_main, text_y_main))
+        return surface
 
 
     def tick(self, _, clock):
@@ -1132,7 +2171,7 @@ class PersistentWarning(object):
         self.symbol_color = (255, 255, 0)   
         self.is_active = False
 
-        self.symbol_font = pygame.font.Font(pygame.font.get_default_font(), 22) 
+        self.symbol_font = load_font(pygame.font.get_default_font(), 22) 
 
     def set_warning_status(self, text="", active=False):
         self.is_active = active
@@ -1174,13 +2213,83 @@ class PersistentWarning(object):
             render_pos_y = 10 
             display.blit(self.text_surface, (render_pos_x, render_pos_y))
 
+# +------------------------------------------------------------------------------+
+# | CollisionHistory Class                                                       |
+# +------------------------------------------------------------------------------+
+class CollisionHistory(object):
+    """
+    Fixed-capacity ring buffer of collision events in a NumPy structured array, kept for the whole session
+    (World owns it, so player restarts don't lose it). append() is O(1) and overwrites the oldest event once
+    full; records() and since() return chronological copies for vectorized analysis; export() writes .npy or .csv.
+    """
+    DTYPE = np.dtype([
+        ('frame', np.int64),
+        ('timestamp', np.float64), # Simulation seconds
+        ('other_id', np.int64),
+        ('other_type', 'U64'),
+        ('impulse', np.float32, (3,)), # Normal impulse, N*s
+        ('intensity', np.float32), # |impulse|
+        ('ego_speed_kmh', np.float32)])
+
+    def __init__(self, capacity=COLLISION_HISTORY_CAPACITY):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=self.DTYPE)
+        self._count = 0 # Events ever appended; the next one goes to _count % capacity
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def total(self):
+        return self._count
+
+    def append(self, frame, timestamp, other_id, other_type, impulse, ego_speed_kmh):
+        with self._lock:
+            self._data[self._count % self.capacity] = (
+                frame, timestamp, other_id, other_type, impulse,
+                math.sqrt(impulse[0]**2 + impulse[1]**2 + impulse[2]**2), ego_speed_kmh)
+            self._count += 1
+
+    def records(self):
+        """All kept events, oldest first (a copy)."""
+        with self._lock:
+            if self._count <= self.capacity:
+                return self._data[:self._count].copy()
+            start = self._count % self.capacity
+            return np.concatenate((self._data[start:], self._data[:start]))
+
+    def since(self, seconds, now):
+        """Events in the last `seconds` of simulation time up to `now`, the current simulation time (hud.simulation_time)."""
+        records = self.records()
+        return records[records['timestamp'] >= now - seconds]
+
+    def export(self, path):
+        records = self.records()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['frame', 'timestamp', 'other_id', 'other_type', 'impulse_x', 'impulse_y', 'impulse_z',
+                                 'intensity', 'ego_speed_kmh'])
+                for r in records:
+                    writer.writerow([r['frame'], '%.4f' % r['timestamp'], r['other_id'], r['other_type']] +
+                                    ['%.3f' % v for v in r['impulse']] + ['%.3f' % r['intensity'], '%.2f' % r['ego_speed_kmh']])
+        else:
+            np.save(path, records)
+        logging.info(f"Collision history ({records.size} of {self._count} events) exported to {path}")
+
+
 # +------------------------------------------------------------------------------+
 # | CollisionSensor Class                                                        |
 # +------------------------------------------------------------------------------+
 class CollisionSensor(object):
-    def __init__(self, parent_actor, hud):
+    def __init__(self, parent_actor, hud, frame_queue=None, history=None, state_cache=None):
         self.sensor = None
-        self.history = []
+        self.history = history if history is not None else CollisionHistory() # MODIFIED: Structured ring buffer
+        self._state_cache = state_cache
         self._parent = parent_actor
         self.hud = hud
         self._last_penalty_time = 0 
@@ -1205,6 +2314,10 @@ class CollisionSensor(object):
             self.hud.error("Collision sensor None post-spawn")
             return
         
+        if frame_queue is not None:
+            # Synchronous mode: events are handled by World.on_sync_frame on the main thread
+            self.sensor.listen(frame_queue.put)
+            return
         weak_self = weakref.ref(self)
         self.sensor.listen(lambda event: CollisionSensor._on_collision(weak_self, event))
 
@@ -1212,7 +2325,10 @@ class CollisionSensor(object):
         return self.total_raw_collisions 
     
     @staticmethod
-    def _on_collision(weak_self, event):
+    @profile_callback('sensor_collision')
+    def _on_collision(weak_self, event, event_time=None):
+        # event_time: when the event reached the client; in synchronous mode it is stamped by the SensorFrameQueue
+        event_time = time.perf_counter() if event_time is None else event_time
         self = weak_self()
         if not self or not self.hud : return 
 
@@ -1220,27 +2336,37 @@ class CollisionSensor(object):
 
         current_time = time.time() 
         if current_time > self._last_penalty_time + COLLISION_COOLDOWN_SECONDS:
-            self.hud.deduct_score(COLLISION_PENALTY, "collision")
+            self.hud.deduct_score(COLLISION_PENALTY, "collision", event_time)
             self._last_penalty_time = current_time
         
         impulse = event.normal_impulse
-        intensity = math.sqrt(impulse.x**2 + impulse.y**2 + impulse.z**2)
-        self.history.append((event.frame, intensity))
-        if len(self.history) > 4000: self.history.pop(0) 
+        other = event.other_actor
+        cache = self._state_cache
+        if cache is not None and cache.velocity is not None:
+            ego_speed_kmh = cache.speed_kmh
+        else:
+            velocity = self._parent.get_velocity()
+            ego_speed_kmh = 3.6 * math.sqrt(velocity.x**2 + velocity.y**2 + velocity.z**2)
+        self.history.append(event.frame, event.timestamp, other.id if other is not None else -1,
+                            other.type_id if other is not None else '', (impulse.x, impulse.y, impulse.z), ego_speed_kmh)
 
 
 # +------------------------------------------------------------------------------+
 # | LaneInvasionSensor Class                                                     |
 # +------------------------------------------------------------------------------+
 class LaneInvasionSensor(object):
-    def __init__(self, parent_actor, hud):
+    def __init__(self, parent_actor, hud, frame_queue=None, state_cache=None):
         self.sensor = None
         self._parent = parent_actor
         self.hud = hud
+        # MODIFIED: The cache also holds the map and the recent lane waypoint; a private one just caches the map
+        self._state_cache = state_cache if state_cache is not None else ActorStateCache()
         self.total_raw_invasions = 0 
         self._last_penalty_frame = -1 # Frame-based cooldown for penalties
 
         world = self._parent.get_world()
+        self._world = world
+        self._state_cache.get_map(world) # Fetched here rather than on the first (burst of) lane events
         bp = world.get_blueprint_library().find('sensor.other.lane_invasion')
         if bp is None: 
             logging.error("Lane invasion sensor blueprint not found!")
@@ -1260,6 +2386,10 @@ class LaneInvasionSensor(object):
             self.hud.error("Lane invasion sensor None post-spawn")
             return
 
+        if frame_queue is not None:
+            # Synchronous mode: events are handled by World.on_sync_frame on the main thread
+            self.sensor.listen(frame_queue.put)
+            return
         weak_self = weakref.ref(self) 
         self.sensor.listen(lambda event: LaneInvasionSensor._on_invasion(weak_self, event))
 
@@ -1267,44 +2397,50 @@ class LaneInvasionSensor(object):
         return self.total_raw_invasions
     
     @staticmethod
-    def _on_invasion(weak_self, event):
+    @profile_callback('sensor_lane_invasion')
+    def _on_invasion(weak_self, event, event_time=None):
+        # event_time as in CollisionSensor._on_collision
+        event_time = time.perf_counter() if event_time is None else event_time
         self = weak_self()
         if not self or not self.hud: return
 
         self.total_raw_invasions += 1 
 
-        player = self._parent
-        world = player.get_world()
-        carla_map = world.get_map()
-        player_transform = player.get_transform()
-        player_location = player_transform.location
+        # Transform and lane from the per-tick cache when available (populated once World.tick has run);
+        # events of one burst share the tick's single waypoint lookup
+        cache = self._state_cache
+        if cache.transform is not None:
+            player_transform = cache.transform
+            # Waypoint for the lane the player is currently occupying *after* the invasion
+            occupied_waypoint, occupied_lane_dir = cache.lane_waypoint(self._world)
+        else:
+            player_transform = self._parent.get_transform()
+            occupied_waypoint = cache.get_map(self._world).get_waypoint(
+                player_transform.location, project_to_road=True, lane_type=carla.LaneType.Driving)
+            occupied_lane_dir = None
         player_forward_vec = player_transform.get_forward_vector()
 
-        # Waypoint for the lane the player is currently occupying *after* the invasion
-        occupied_waypoint = carla_map.get_waypoint(player_location, project_to_road=True, lane_type=carla.LaneType.Driving)
-
         if not occupied_waypoint:
             # If no occupied waypoint is found, it's an unknown lane violation
             current_frame = self.hud.frame
             if current_frame > self._last_penalty_frame + 30:
-                self.hud.deduct_score(LANE_VIOLATION_PENALTY, "lane_violation_unknown")
+                self.hud.deduct_score(LANE_VIOLATION_PENALTY, "lane_violation_unknown", event_time)
                 self._last_penalty_frame = current_frame
             return
 
-        occupied_lane_forward_vec = occupied_waypoint.transform.get_forward_vector()
-        
-        # Use 2D vectors for directional comparison on the XY plane
-        player_forward_vec_2d = carla.Vector2D(player_forward_vec.x, player_forward_vec.y)
-        if player_forward_vec_2d.length()**2 > 0: # Avoid division by zero if vector is (0,0)
-            player_forward_vec_2d = player_forward_vec_2d.make_unit_vector()
+        if occupied_lane_dir is None:
+            occupied_lane_forward_vec = occupied_waypoint.transform.get_forward_vector()
+            length = math.hypot(occupied_lane_forward_vec.x, occupied_lane_forward_vec.y)
+            occupied_lane_dir = (occupied_lane_forward_vec.x / length, occupied_lane_forward_vec.y / length) if length > 0 else (0.0, 0.0)
 
-        occupied_lane_forward_vec_2d = carla.Vector2D(occupied_lane_forward_vec.x, occupied_lane_forward_vec.y)
-        if occupied_lane_forward_vec_2d.length()**2 > 0:
-            occupied_lane_forward_vec_2d = occupied_lane_forward_vec_2d.make_unit_vector()
+        # Use unit 2D vectors for directional comparison on the XY plane
+        player_length = math.hypot(player_forward_vec.x, player_forward_vec.y)
+        if player_length == 0: # Avoid division by zero if vector is (0,0)
+            player_length = 1.0
 
         # Calculate dot product to determine if player is going against the lane direction
-        dot_product_with_occupied_lane = player_forward_vec_2d.x * occupied_lane_forward_vec_2d.x + \
-                                         player_forward_vec_2d.y * occupied_lane_forward_vec_2d.y
+        dot_product_with_occupied_lane = (player_forward_vec.x * occupied_lane_dir[0] +
+                                          player_forward_vec.y * occupied_lane_dir[1]) / player_length
 
         is_oncoming_violation = False
         is_solid_line_violation = False
@@ -1334,7 +2470,7 @@ class LaneInvasionSensor(object):
             elif is_solid_line_violation:
                 actual_penalty_amount = int(LANE_VIOLATION_PENALTY * SOLID_LINE_CROSSING_PENALTY_MULTIPLIER)
             
-            self.hud.deduct_score(actual_penalty_amount, violation_type_for_penalty)
+            self.hud.deduct_score(actual_penalty_amount, violation_type_for_penalty, event_time)
             self._last_penalty_frame = current_frame
 
 # +------------------------------------------------------------------------------+
@@ -1370,17 +2506,241 @@ class GnssSensor(object):
         if not self: return
         self.lat, self.lon = event.latitude, event.longitude
 
+# +------------------------------------------------------------------------------+
+# | LidarRenderer Class                                                          |
+# +------------------------------------------------------------------------------+
+class LidarRenderer(object):
+    """
+    Bird's-eye view of ray-cast lidar sweeps (x, y, z, intensity float32 points) drawn into preallocated
+    buffers. Forward (+x) points up the screen and right (+y) to the right. Points are coloured by intensity,
+    by height, or by a point-density image accumulated over sweeps with exponential decay. When a sweep takes
+    longer than budget_ms to project and colour, only every step-th point of the following sweeps is drawn.
+    """
+    MODES = ('intensity', 'height', 'density')
+    HEIGHT_RANGE = (-2.5, 1.5) # Metres relative to the sensor, spread over the height palette
+    DENSITY_GAIN = 32.0 # Palette levels per accumulated point
+    MAX_STEP = 16
+
+    def __init__(self, dim, lidar_range=LIDAR_RANGE, mode='intensity', budget_ms=LIDAR_FRAME_BUDGET_MS,
+                 density_decay=LIDAR_DENSITY_DECAY):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown lidar colour mode '{mode}', expected one of {self.MODES}")
+        self.dim = (int(dim[0]), int(dim[1]))
+        self.mode = mode
+        self.scale = min(self.dim) / (2.0 * lidar_range)
+        self.budget_ms = budget_ms
+        self.density_decay = density_decay
+        self.step = 1
+        self.points_drawn = 0
+        self.draw_ms = 0.0
+        pixel_count = self.dim[0] * self.dim[1]
+        self._sink = pixel_count # Points outside the view are written to one spare pixel past the image
+        self._canvas = np.zeros(pixel_count + 1, dtype=np.uint32)
+        self._palette = self._build_palette(mode)
+        if mode == 'density':
+            self._density = np.zeros(pixel_count + 1, dtype=np.float32)
+            self._density_scaled = np.empty(pixel_count, dtype=np.float32)
+            self._density_level = np.empty(pixel_count, dtype=np.uint8)
+        self._capacity = 0
+        self._reserve(1 << 17)
+
+    @staticmethod
+    def _build_palette(mode):
+        # 256 colours packed as 0x00RRGGBB, the pixel format of BGRA_MASKS surfaces
+        stops = {
+            'intensity': [(0.0, (40, 60, 160)), (0.35, (0, 200, 255)), (0.7, (255, 230, 0)), (1.0, (255, 255, 255))],
+            'height': [(0.0, (70, 0, 140)), (0.3, (0, 110, 255)), (0.55, (0, 220, 120)), (0.8, (255, 200, 0)), (1.0, (255, 40, 0))],
+            'density': [(0.0, (0, 0, 0)), (0.15, (90, 0, 110)), (0.5, (230, 60, 30)), (0.8, (255, 190, 0)), (1.0, (255, 255, 220))],
+        }[mode]
+        levels = np.linspace(0.0, 1.0, 256)
+        positions = [p for p, _ in stops]
+        channels = [np.interp(levels, positions, [c[i] for _, c in stops]).astype(np.uint32) for i in range(3)]
+        return (channels[0] << 16) | (channels[1] << 8) | channels[2]
+
+    def _reserve(self, count):
+        # Per-point scratch buffers only grow, so steady-state sweeps allocate nothing
+        if count <= self._capacity:
+            return
+        self._capacity = max(count, 2 * self._capacity)
+        self._col = np.empty(self._capacity, dtype=np.float32)
+        self._row = np.empty(self._capacity, dtype=np.float32)
+        self._value = np.empty(self._capacity, dtype=np.float32)
+        self._index = np.empty(self._capacity, dtype=np.int64)
+        self._level = np.empty(self._capacity, dtype=np.uint8)
+        self._color = np.empty(self._capacity, dtype=np.uint32)
+        self._outside = np.empty(self._capacity, dtype=bool)
+        self._scratch = np.empty(self._capacity, dtype=bool)
+
+    def draw(self, raw_data, surface):
+        """Draws one sweep into a BGRA_MASKS surface of size dim."""
+        start = time.perf_counter()
+        width, height = self.dim
+        points = np.frombuffer(raw_data, dtype=np.float32).reshape(-1, 4)[::self.step]
+        count = points.shape[0]
+        self._reserve(count)
+        col, row, index = self._col[:count], self._row[:count], self._index[:count]
+        outside, scratch = self._outside[:count], self._scratch[:count]
+
+        # Pixel position without abs(), so points behind or left of the sensor are no longer mirrored
+        np.multiply(points[:, 1], self.scale, out=col)
+        col += width / 2.0
+        np.multiply(points[:, 0], -self.scale, out=row)
+        row += height / 2.0
+        np.floor(col, out=col)
+        np.floor(row, out=row)
+        np.clip(col, -1, width, out=col)
+        np.clip(row, -1, height, out=row)
+        np.less(col, 0, out=outside)
+        np.greater_equal(col, width, out=scratch)
+        outside |= scratch
+        np.less(row, 0, out=scratch)
+        outside |= scratch
+        np.greater_equal(row, height, out=scratch)
+        outside |= scratch
+        row *= width
+        row += col
+        np.copyto(index, row, casting='unsafe')
+        np.copyto(index, self._sink, where=outside)
+
+        if self.mode == 'density':
+            density = self._density
+            density *= self.density_decay
+            np.add.at(density, index, np.float32(1.0)) # Matching dtype keeps ufunc.at on its fast path
+        else:
+            value, level, color = self._value[:count], self._level[:count], self._color[:count]
+            if self.mode == 'intensity':
+                np.multiply(points[:, 3], 255.0, out=value)
+            else:
+                low, high = self.HEIGHT_RANGE
+                np.subtract(points[:, 2], low, out=value)
+                value *= 255.0 / (high - low)
+            np.clip(value, 0, 255, out=value)
+            np.copyto(level, value, casting='unsafe')
+            np.take(self._palette, level, out=color, mode='clip') # 'clip' skips the bounds check
+            self._canvas.fill(0)
+            self._canvas[index] = color
+        # Only the per-point work above is budgeted; decimating cannot speed up the full-image passes below
+        self._adapt((time.perf_counter() - start) * 1000.0)
+
+        if self.mode == 'density':
+            np.multiply(self._density[:self._sink], self.DENSITY_GAIN, out=self._density_scaled)
+            np.minimum(self._density_scaled, 255.0, out=self._density_scaled)
+            np.copyto(self._density_level, self._density_scaled, casting='unsafe')
+            np.take(self._palette, self._density_level, out=self._canvas[:self._sink], mode='clip')
+        pixels = np.asarray(surface.get_view('1')).view(np.uint32)
+        np.copyto(pixels, self._canvas[:self._sink])
+        del pixels # Releases the surface lock before the surface is blitted
+        self.points_drawn = count - int(np.count_nonzero(outside))
+        self.draw_ms = (time.perf_counter() - start) * 1000.0
+
+    def _adapt(self, elapsed_ms):
+        if elapsed_ms > self.budget_ms and self.step < self.MAX_STEP:
+            self.step *= 2
+            logging.debug(f"Lidar sweep took {elapsed_ms:.1f} ms, drawing every {self.step}th point")
+        elif elapsed_ms < self.budget_ms / 4.0 and self.step > 1:
+            self.step //= 2
+
+# +------------------------------------------------------------------------------+
+# | FrameSurfacePool Class                                                       |
+# +------------------------------------------------------------------------------+
+class FrameSurfacePool(object):
+    """
+    BGRA camera surfaces with explicit ownership, so a surface is never written while it may be blitted
+    (get_view() locks a surface, and blitting a locked surface raises pygame.error).
+    The producer takes a surface with acquire(), fills it and publish()es it as the current frame.
+    Readers checkout() the current frame and release() it after blitting. A surface goes back on the
+    free list only once it is neither current nor checked out; when none is free the frame is dropped.
+    """
+    def __init__(self, limit=4):
+        # 4 covers the worst case without drops: one being written, the current one, one waiting in
+        # the RenderThread's DoubleBuffer and one being blitted
+        self.limit = limit
+        self.current = None
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._size = None
+        self._free = []
+        self._owned = set() # Surfaces of the current size that are off the free list
+        self._refs = {} # Surface -> 1 while current + 1 per checkout
+
+    def acquire(self, width, height):
+        """Returns a surface for the producer to fill, or None if every surface is still in use."""
+        with self._lock:
+            if (width, height) != self._size:
+                # Surfaces of the old size are dropped as they are released instead of being recycled
+                self._size, self._free, self._owned = (width, height), [], set()
+            if self._free:
+                surface = self._free.pop()
+            elif len(self._owned) < self.limit:
+                surface = pygame.Surface((width, height), 0, 32, BGRA_MASKS)
+            else:
+                self.dropped += 1
+                return None
+            self._owned.add(surface)
+            return surface
+
+    def publish(self, surface):
+        """Makes an acquired, filled surface the current frame."""
+        with self._lock:
+            self._refs[surface] = self._refs.get(surface, 0) + 1
+            previous, self.current = self.current, surface
+            if previous is not None:
+                self._unref(previous)
+
+    def discard(self, surface):
+        """Returns an acquired surface that was not published (e.g. the conversion failed)."""
+        with self._lock:
+            self._recycle(surface)
+
+    def checkout(self):
+        """Returns the current frame, held until release(), or None before the first frame."""
+        with self._lock:
+            surface = self.current
+            if surface is not None:
+                self._refs[surface] += 1
+            return surface
+
+    def release(self, surface):
+        with self._lock:
+            self._unref(surface)
+
+    def _unref(self, surface):
+        count = self._refs[surface] - 1
+        if count:
+            self._refs[surface] = count
+        else:
+            del self._refs[surface]
+            self._recycle(surface)
+
+    def _recycle(self, surface):
+        if surface in self._owned:
+            self._owned.remove(surface)
+            self._free.append(surface)
+
 # +------------------------------------------------------------------------------+
 # | CameraManager Class                                                          |
 # +------------------------------------------------------------------------------+
 class CameraManager(object):
-    def __init__(self, parent_actor, hud, fov=90.0): 
+    def __init__(self, parent_actor, hud, fov=90.0, frame_queue=None, render_scale=1.0, video_sink=None, warm_sensors=0): 
         self.sensor = None
-        self.surface = None
         self._parent = parent_actor
         self.hud = hud
         self.fov = fov 
+        self.render_scale = render_scale # ADDED: Cameras render at hud.dim * render_scale and are upscaled on the client
+        self._frame_queue = frame_queue # ADDED: Set in synchronous mode, images are parsed on the main thread
+        self.surfaces = FrameSurfacePool() # ADDED: Reused BGRA surfaces the camera frames are copied into
+        self._lidar_renderer = None # ADDED: Created for the first lidar sweep, rebuilt when the colour mode changes
+        self._sensor_pool = {} # ADDED: (blueprint id, transform index) -> spawned sensor, see set_sensor()
+        self.warm_sensors = warm_sensors # ADDED: Sensors either side of the displayed one kept in the pool, see warm_pool()
+        self._active_key = None
+        self._depth_image = None # ADDED: Latest depth image, decoded to metres on demand by depth_meters()
+        self._depth_frame = None
+        self._depth_buffers = None
+        # ADDED: In asynchronous mode frames are converted by a worker, the sensor callback only hands them over
+        self._image_worker = ImageWorker(self) if frame_queue is None else None
         self.recording = False
+        self.recorder = None # ADDED: FrameRecorder while camera recording is on
+        self.video_sink = video_sink # ADDED: VideoRecorder for the raw camera stream
         self._camera_transforms = [
             carla.Transform(carla.Location(x=-10, z=7), carla.Rotation(pitch=-20)), 
             carla.Transform(carla.Location(x=1.05,y=-0.4, z=1.6), carla.Rotation(pitch=0)) 
@@ -1393,7 +2753,10 @@ class CameraManager(object):
             ['sensor.camera.depth', cc.LogarithmicDepth, 'Camera Depth (Logarithmic Gray Scale)'],
             ['sensor.camera.semantic_segmentation', cc.Raw, 'Camera Semantic Segmentation (Raw)'],
             ['sensor.camera.semantic_segmentation', cc.CityScapesPalette, 'Camera Semantic Segmentation (CityScapes Palette)'],
-            ['sensor.lidar.ray_cast', None, 'Lidar (Ray-Cast)']
+            # MODIFIED: For lidar the second field is the LidarRenderer colour mode
+            ['sensor.lidar.ray_cast', 'intensity', 'Lidar (Intensity)'],
+            ['sensor.lidar.ray_cast', 'height', 'Lidar (Height)'],
+            ['sensor.lidar.ray_cast', 'density', 'Lidar (Point Density)']
         ]
         world = self._parent.get_world()
         bp_library = world.get_blueprint_library()
@@ -1405,70 +2768,126 @@ class CameraManager(object):
                 continue
 
             if item[0].startswith('sensor.camera'):
-                bp.set_attribute('image_size_x', str(hud.dim[0]))
-                bp.set_attribute('image_size_y', str(hud.dim[1]))
+                bp.set_attribute('image_size_x', str(self.image_size[0]))
+                bp.set_attribute('image_size_y', str(self.image_size[1]))
                 if bp.has_attribute('fov'):
                     if item[0] == 'sensor.camera.rgb':
                          bp.set_attribute('fov', str(self.fov)) 
                     else: 
                         bp.set_attribute('fov', '90') 
             elif item[0].startswith('sensor.lidar'):
-                if bp.has_attribute('range'): bp.set_attribute('range', '50')
+                if bp.has_attribute('range'): bp.set_attribute('range', str(LIDAR_RANGE))
             item.append(bp)
         self.index = None 
 
+    @property
+    def image_size(self):
+        return (max(1, int(self.hud.dim[0] * self.render_scale)), max(1, int(self.hud.dim[1] * self.render_scale)))
+
+    def set_render_scale(self, render_scale):
+        """Changes the camera resolution; the active sensor is respawned since image size is fixed at spawn."""
+        self.render_scale = render_scale
+        width, height = self.image_size
+        for item in self.sensors:
+            if item[0].startswith('sensor.camera') and item[-1] is not None:
+                item[-1].set_attribute('image_size_x', str(width))
+                item[-1].set_attribute('image_size_y', str(height))
+        logging.info(f"Render scale {render_scale:.2f}: cameras now {width}x{height}")
+        # Pooled cameras still have the old size; drop them and respawn the displayed one
+        for key in [key for key in self._sensor_pool if key[0].startswith('sensor.camera')]:
+            sensor = self._sensor_pool.pop(key)
+            sensor.stop()
+            sensor.destroy()
+            if key == self._active_key:
+                self.sensor = None
+                self._active_key = None
+        if self.index is not None and self.sensors[self.index][0].startswith('sensor.camera'):
+            self.set_sensor(self.index, notify=False)
+
     def toggle_camera(self):
         self.transform_index = (self.transform_index + 1) % len(self._camera_transforms)
-        if self.sensor: 
+        if self.index is not None:
+            self.set_sensor(self.index, notify=False) # MODIFIED: Switches to the pooled sensor at the new mount
+
+    def warm_pool(self):
+        """
+        Keeps idle sensors for the `warm_sensors` entries either side of the displayed one (next_sensor order)
+        spawned at the current mount, so switching to them needs no spawn. Every other pooled sensor is
+        destroyed: each one is a full-size sensor on the server, so only the likely next switches are kept.
+        """
+        if self.index is None:
+            return
+        wanted = {self._active_key}
+        for offset in range(1, self.warm_sensors + 1):
+            for index in (self.index + offset, self.index - offset):
+                item = self.sensors[index % len(self.sensors)]
+                if item[-1] is not None and self._pooled_sensor(item, self.transform_index) is not None:
+                    wanted.add((item[0], self.transform_index))
+        for key in [key for key in self._sensor_pool if key not in wanted]:
+            sensor = self._sensor_pool.pop(key)
+            sensor.stop()
+            sensor.destroy()
+
+    def _pooled_sensor(self, item, transform_index):
+        # One sensor per (blueprint, mount); colour variants of the same blueprint share it
+        key = (item[0], transform_index)
+        sensor = self._sensor_pool.get(key)
+        if sensor is None:
             try:
-                self.sensor.set_transform(self._camera_transforms[self.transform_index])
+                sensor = self._parent.get_world().spawn_actor(
+                    item[-1], 
+                    self._camera_transforms[transform_index], 
+                    attach_to=self._parent)
             except RuntimeError as e:
-                logging.error(f"Error setting camera transform: {e}")
-                self.hud.error(f"Cam transform error: {e}")
-
+                logging.error(f"Error spawning sensor {item[0]}: {e}")
+                self.hud.error(f"Spawn {item[2]} failed: {e}")
+                return None
+            if sensor is None: 
+                logging.error(f"Sensor {item[0]} is None after spawn attempt.")
+                self.hud.error(f"{item[2]} None post-spawn")
+                return None
+            self._sensor_pool[key] = sensor
+        return sensor
 
     def set_sensor(self, index, notify=True):
         index = index % len(self.sensors)
+        item = self.sensors[index]
         
-        if self.sensors[index][-1] is None:
+        if item[-1] is None:
             logging.warning(f"Cannot set sensor: Blueprint for {item[0]} not found. Skipping.")
-            if notify: self.hud.error(f"Sensor {self.sensors[index][2]} unavailable (BP missing)")
+            if notify: self.hud.error(f"Sensor {item[2]} unavailable (BP missing)")
             return
 
-        needs_respawn = True 
-        if self.index is not None and self.sensors[index][0] == self.sensors[self.index][0]:
-            needs_respawn = False 
-            needs_respawn = True 
-
-
-        if needs_respawn:
-            if self.sensor is not None:
-                self.sensor.destroy()
-                self.surface = None
-            try:
-                self.sensor = self._parent.get_world().spawn_actor(
-                    self.sensors[index][-1], 
-                    self._camera_transforms[self.transform_index], 
-                    attach_to=self._parent)
-            except RuntimeError as e:
-                logging.error(f"Error spawning sensor {self.sensors[index][0]}: {e}")
-                self.hud.error(f"Spawn {self.sensors[index][2]} failed: {e}")
-                self.sensor = None
-                self.index = None
-                return
-
-            if self.sensor is None: 
-                logging.error(f"Sensor {self.sensors[index][0]} is None after spawn attempt.")
-                self.hud.error(f"{self.sensors[index][2]} None post-spawn")
+        # MODIFIED: Sensors are taken from a pool instead of respawned on every switch. Only the displayed one
+        # listens; idle sensors are stopped, so the server streams nothing for them. The last frame stays on
+        # screen until the new sensor delivers, and switching between colour variants changes nothing server-side.
+        # The pool holds the displayed sensor plus its --warm-sensors neighbours (none by default).
+        key = (item[0], self.transform_index)
+        if key != self._active_key:
+            sensor = self._pooled_sensor(item, self.transform_index)
+            if sensor is None:
                 self.index = None
                 return
-
+            if self.sensor is not None:
+                self.sensor.stop()
+            self.sensor = sensor
+            self._active_key = key
+            if self._frame_queue is not None:
+                self._frame_queue.clear() # Drop frames still queued from the previous sensor
             weak_self = weakref.ref(self)
-            self.sensor.listen(lambda image: CameraManager._parse_image(weak_self, image))
+            self.sensor.listen(lambda image: CameraManager._on_image(weak_self, image, key))
         
-        if notify: self.hud.notification(self.sensors[index][2]) 
+        if notify: self.hud.notification(item[2]) 
         self.index = index
-
+        self.warm_pool()
+
+    def destroy_sensors(self):
+        for sensor in self._sensor_pool.values():
+            sensor.stop()
+            sensor.destroy()
+        self._sensor_pool = {}
+        self._active_key = None
+        self.sensor = None
 
     def next_sensor(self):
         current_index = self.index if self.index is not None else -1
@@ -1481,17 +2900,76 @@ class CameraManager(object):
             try:
                 if not os.path.exists('_out'): 
                     os.makedirs('_out')
+                # Camera frames go to chunk files in their own session directory, lidar still uses save_to_disk
+                session_dir = os.path.join('_out', 'recording_%s' % datetime.datetime.now().strftime('%Y%m%d_%H%M%S'))
+                self.recorder = FrameRecorder(session_dir, self.hud)
             except OSError as e:
                 logging.error(f"Error creating output directory '_out': {e}")
                 self.hud.error(f"Record dir error: {e}")
                 self.recording = False 
+        else:
+            self.stop_recorder()
+
+    def stop_recorder(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.stop() # Remaining chunks are written in the background
+
+
+    def stop_worker(self):
+        if self._image_worker is not None:
+            self._image_worker.stop()
+            self._image_worker = None
 
+    @property
+    def surface(self):
+        """The latest converted frame; blit it through surfaces.checkout()/release() instead."""
+        return self.surfaces.current
 
     def render(self, display):
-        if self.surface is not None: 
-            display.blit(self.surface, (0, 0))
+        # Checked out so the worker cannot start writing into it before the blit is done
+        surface = self.surfaces.checkout()
+        if surface is not None:
+            try:
+                blit_camera_surface(display, surface)
+            finally:
+                self.surfaces.release(surface)
+
+    def depth_meters(self):
+        """
+        Returns (frame, H x W float16 metres) for the latest image of the active depth camera, or None.
+        The array is reused once a newer frame is decoded; copy it to keep it.
+        """
+        image = self._depth_image
+        if image is None or self.index is None or self.sensors[self.index][0] != 'sensor.camera.depth':
+            return None
+        if self._depth_frame != image.frame:
+            shape = (image.height, image.width)
+            if self._depth_buffers is None or self._depth_buffers[0].shape != shape:
+                self._depth_buffers = (np.empty(shape, dtype=np.float16), np.empty((2,) + shape, dtype=np.float32))
+            decode_depth(image.raw_data, *self._depth_buffers)
+            self._depth_frame = image.frame
+        return self._depth_frame, self._depth_buffers[0]
+
+    @staticmethod
+    @profile_callback('camera_callback')
+    def _on_image(weak_self, image, key=None):
+        # Sensor callback thread: record, then hand the frame on without converting it here
+        self = weak_self()
+        if not self or key != self._active_key: # Late data from a sensor that was just put back in the pool
+            return
+        recorder = self.recorder
+        if recorder is not None and hasattr(image, 'width'):
+            recorder.add(image)
+        if self.video_sink is not None and hasattr(image, 'width') and self.video_sink.due(image.timestamp):
+            self.video_sink.submit(bytes(image.raw_data), (image.width, image.height), image.timestamp)
+        if self._frame_queue is not None:
+            self._frame_queue.put(image)
+        elif self._image_worker is not None:
+            self._image_worker.submit(image)
 
     @staticmethod
+    @profile_callback('sensor_camera')
     def _parse_image(weak_self, image):
         self = weak_self()
         if not self or self.index is None or self.sensors[self.index][-1] is None: 
@@ -1499,106 +2977,1350 @@ class CameraManager(object):
         
         sensor_type = self.sensors[self.index][0]
         color_converter = self.sensors[self.index][1]
+        if hasattr(image, 'width') != sensor_type.startswith('sensor.camera'):
+            return # Queued before a switch between camera and lidar
+        if sensor_type == 'sensor.camera.depth':
+            self._depth_image = image
+
+        if self.hud.headless:
+            pass # No display to convert for; only recording below still runs
+        elif sensor_type.startswith('sensor.lidar'):
+            # MODIFIED: Drawn by a LidarRenderer into reused buffers (was np.zeros + fabs + make_surface per sweep)
+            renderer = self._lidar_renderer
+            if renderer is None or renderer.mode != color_converter or renderer.dim != tuple(self.hud.dim):
+                renderer = self._lidar_renderer = LidarRenderer(self.hud.dim, mode=color_converter)
+            surface = self.surfaces.acquire(*self.hud.dim)
+            if surface is None:
+                return # Every surface is still being displayed, drop the sweep
+            try:
+                with self.hud.profiler.measure('camera_convert'):
+                    renderer.draw(image.raw_data, surface)
+            except Exception:
+                self.surfaces.discard(surface)
+                raise
+            self.surfaces.publish(surface)
 
-        if sensor_type.startswith('sensor.lidar'):
-            points = np.frombuffer(image.raw_data, dtype=np.dtype('f4'))
-            points = np.reshape(points, (int(points.shape[0] / 4), 4)) 
-            lidar_data = np.array(points[:, :2]) 
-            
-            lidar_data *= min(self.hud.dim) / (2 * 50.0) 
-            lidar_data[:,0] += self.hud.dim[0] / 2.0 
-            lidar_data[:,1] += self.hud.dim[1] / 2.0 
-            
-            lidar_data = np.fabs(lidar_data) 
-            lidar_data = lidar_data.astype(np.int32)
-            
-            valid_points_mask = (lidar_data[:, 0] < self.hud.dim[0]) & (lidar_data[:, 0] >= 0) & \
-                                (lidar_data[:, 1] < self.hud.dim[1]) & (lidar_data[:, 1] >= 0)
-            lidar_data = lidar_data[valid_points_mask]
-            
-            lidar_img_size = (self.hud.dim[0], self.hud.dim[1], 3)
-            lidar_img = np.zeros(lidar_img_size, dtype=np.uint8)
-            
-            if lidar_data.shape[0] > 0:
-                 lidar_img[lidar_data[:, 1], lidar_data[:, 0]] = (255, 255, 255) 
-            
-            self.surface = pygame.surfarray.make_surface(lidar_img.swapaxes(0,1)) 
-        
         elif sensor_type.startswith('sensor.camera'):
-            if color_converter is not None: 
-                image.convert(color_converter)
-            
-            array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
-            array = np.reshape(array, (image.height, image.width, 4)) 
-            array = array[:, :, :3] 
-            array = array[:, :, ::-1] 
-            self.surface = pygame.surfarray.make_surface(array.swapaxes(0, 1)) 
+            # MODIFIED: BGRA buffer copied straight into a reused surface (was reshape/slice/flip/swapaxes/make_surface)
+            surface = self.surfaces.acquire(image.width, image.height)
+            if surface is None:
+                return # Every surface is still being displayed, drop the frame
+            try:
+                converter = CLIENT_CONVERTERS.get(color_converter)
+                # Only recorded by the thread converting frames (ImageWorker, or the main thread in sync mode)
+                with self.hud.profiler.measure('camera_convert'):
+                    if converter is not None:
+                        converter(image.raw_data, surface) # MODIFIED: LUT conversion, replaces the in-place image.convert()
+                    else:
+                        copy_bgra_to_surface(image.raw_data, surface)
+            except Exception:
+                self.surfaces.discard(surface)
+                raise
+            self.surfaces.publish(surface)
         
-        if self.recording and hasattr(image, 'save_to_disk'): 
+        if self.recording and not hasattr(image, 'width') and hasattr(image, 'save_to_disk'): # Lidar point clouds
             try:
                 image.save_to_disk('_out/%08d' % image.frame)
             except Exception as e: 
                 logging.error(f"Error saving image to disk: {e}")
                 self.recording = False 
 
+# +------------------------------------------------------------------------------+
+# | FrameRecorder Class                                                          |
+# +------------------------------------------------------------------------------+
+def write_frame_chunk(shm_name, shape, count, index, path):
+    """Writer-process side of FrameRecorder: dumps the first `count` frames of a shared-memory chunk to .npy files."""
+    block = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frames = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)[:count]
+        np.save(path + '.frames.npy', frames)
+        np.save(path + '.index.npy', index)
+        del frames # Must not outlive block.buf
+    finally:
+        block.close()
+    return path
+
+
+class FrameRecorder(object):
+    """
+    Records camera frames without blocking the sensor callback. Frames are copied into a bounded set
+    of shared-memory chunk buffers, and full chunks are written by a process pool as
+    chunk_NNNNN.frames.npy (uint8, N x H x W x 4 BGRA) plus chunk_NNNNN.index.npy (frame, timestamp);
+    both open with np.load(mmap_mode='r'). If every buffer is still waiting on a writer, frames are
+    dropped, counted, reported on the HUD and listed in session.json.
+    """
+    INDEX_DTYPE = np.dtype([('frame', np.int64), ('timestamp', np.float64)])
+
+    def __init__(self, directory, hud=None, chunk_frames=RECORD_CHUNK_FRAMES, queue_chunks=RECORD_QUEUE_CHUNKS,
+                 workers=RECORD_WORKERS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.hud = hud
+        self.chunk_frames = chunk_frames
+        self.queue_chunks = queue_chunks
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        self._lock = threading.RLock() # Re-entrant: a done callback can run inside submit() when a write finishes instantly
+        self._free = queue.Queue() # (generation, SharedMemory) blocks ready to be filled
+        self._generation = 0 # Bumped when the frame size changes; blocks of older generations are freed
+        self._shape = None
+        self._block = None
+        self._index = None
+        self._count = 0
+        self._chunk_id = 0
+        self._closed = False
+        self._last_drop_notice = 0.0
+        self.frames_recorded = 0
+        self.frames_dropped = 0
+        self.dropped_frames = []
+        logging.info(f"Recording camera frames to {directory}")
+
+    def add(self, image):
+        shape = (image.height, image.width, 4)
+        with self._lock:
+            if self._closed:
+                return
+            if shape != self._shape:
+                self._flush()
+                self._allocate(shape)
+            if self._block is None:
+                try:
+                    self._block = self._free.get_nowait()
+                except queue.Empty:
+                    self._drop([image.frame])
+                    return
+                self._index = np.zeros(self.chunk_frames, dtype=self.INDEX_DTYPE)
+                self._count = 0
+            frames = np.ndarray((self.chunk_frames,) + shape, dtype=np.uint8, buffer=self._block[1].buf)
+            np.copyto(frames[self._count], np.frombuffer(image.raw_data, dtype=np.uint8).reshape(shape))
+            del frames
+            self._index[self._count] = (image.frame, image.timestamp)
+            self._count += 1
+            self.frames_recorded += 1
+            if self._count == self.chunk_frames:
+                self._flush()
+
+    def _allocate(self, shape):
+        while True: # Free blocks of the old size right away, in-flight ones are freed when their write finishes
+            try:
+                self._unlink(self._free.get_nowait())
+            except queue.Empty:
+                break
+        self._generation += 1
+        self._shape = shape
+        nbytes = self.chunk_frames * shape[0] * shape[1] * shape[2]
+        for _ in range(self.queue_chunks):
+            self._free.put((self._generation, shared_memory.SharedMemory(create=True, size=nbytes)))
+
+    def _flush(self):
+        block, self._block = self._block, None
+        if block is None:
+            return
+        if self._count == 0:
+            self._release(block)
+            return
+        count, index = self._count, self._index[:self._count].copy()
+        path = os.path.join(self.directory, 'chunk_%05d' % self._chunk_id)
+        self._chunk_id += 1
+        future = self._executor.submit(write_frame_chunk, block[1].name, (self.chunk_frames,) + self._shape, count, index, path)
+        future.add_done_callback(functools.partial(self._on_chunk_written, block, index))
+
+    def _on_chunk_written(self, block, index, future):
+        try:
+            future.result()
+        except Exception as e:
+            logging.error(f"FrameRecorder: failed to write chunk ({len(index)} frames): {e}")
+            with self._lock:
+                self.frames_recorded -= len(index)
+                self._drop(index['frame'].tolist())
+        with self._lock:
+            self._release(block)
+
+    def _release(self, block):
+        if self._closed or block[0] != self._generation:
+            self._unlink(block)
+        else:
+            self._free.put(block)
+
+    @staticmethod
+    def _unlink(block):
+        block[1].close()
+        block[1].unlink()
+
+    def _drop(self, frames):
+        self.frames_dropped += len(frames)
+        self.dropped_frames.extend(frames)
+        now = time.time()
+        if self.hud is not None and now - self._last_drop_notice > 2.0:
+            self._last_drop_notice = now
+            self.hud.notification(f"Recorder dropped {self.frames_dropped} frames", text_color=(255, 150, 50))
+
+    def stop(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._flush()
+            self._closed = True
+            while True:
+                try:
+                    self._unlink(self._free.get_nowait())
+                except queue.Empty:
+                    break
+        # Not a daemon: the interpreter waits for pending chunks before exiting
+        threading.Thread(target=self._finish, name='FrameRecorderFinish').start()
+
+    def _finish(self):
+        self._executor.shutdown(wait=True)
+        manifest = {
+            'format': 'chunk_NNNNN.frames.npy uint8 (N, H, W, 4) BGRA + chunk_NNNNN.index.npy (frame, timestamp)',
+            'frame_shape': list(self._shape) if self._shape else None,
+            'chunks': self._chunk_id,
+            'frames_recorded': self.frames_recorded,
+            'frames_dropped': self.frames_dropped,
+            'dropped_frames': self.dropped_frames,
+        }
+        with open(os.path.join(self.directory, 'session.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        log = logging.warning if self.frames_dropped else logging.info
+        log(f"Recording finished: {self.frames_recorded} frames in {self._chunk_id} chunks, "
+            f"{self.frames_dropped} dropped ({self.directory})")
+
+class LidarRecorder(object):
+    """
+    FrameRecorder counterpart for lidar sweeps, whose size varies from sweep to sweep. The caller only queues
+    the measurement; a writer thread saves it as <frame>.npy (N x 4 float32 x, y, z, intensity). When the
+    bounded queue is full, sweeps are dropped, counted, reported on the HUD and listed in session.json.
+    """
+    def __init__(self, directory, hud=None, queue_sweeps=RECORD_CHUNK_FRAMES * RECORD_QUEUE_CHUNKS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.hud = hud
+        self._queue = queue.Queue(maxsize=queue_sweeps)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._last_drop_notice = 0.0
+        self.frames_recorded = 0
+        self.frames_dropped = 0
+        self.dropped_frames = []
+        self._thread = threading.Thread(target=self._run, name='LidarRecorder', daemon=True)
+        self._thread.start()
+
+    def add(self, sweep):
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(sweep) # The measurement keeps its raw_data alive until it is written
+        except queue.Full:
+            self._drop([sweep.frame])
+
+    def _run(self):
+        while True:
+            sweep = self._queue.get()
+            if sweep is None:
+                return
+            try:
+                points = np.frombuffer(sweep.raw_data, dtype=np.float32).reshape(-1, 4)
+                np.save(os.path.join(self.directory, '%08d.npy' % sweep.frame), points)
+            except (OSError, ValueError) as e:
+                logging.error(f"LidarRecorder: failed to write sweep {sweep.frame}: {e}")
+                self._drop([sweep.frame])
+                continue
+            with self._lock:
+                self.frames_recorded += 1
+
+    def _drop(self, frames):
+        with self._lock:
+            self.frames_dropped += len(frames)
+            self.dropped_frames.extend(frames)
+            now = time.time()
+            if self.hud is not None and now - self._last_drop_notice > 2.0:
+                self._last_drop_notice = now
+                self.hud.notification(f"Lidar recorder dropped {self.frames_dropped} sweeps", text_color=(255, 150, 50))
+
+    def stop(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None) # After the sweeps already queued
+        # Not a daemon: the interpreter waits for pending sweeps before exiting
+        threading.Thread(target=self._finish, name='LidarRecorderFinish').start()
+
+    def _finish(self):
+        self._thread.join()
+        manifest = {
+            'format': 'NNNNNNNN.npy float32 (N, 4) x, y, z, intensity, one file per sweep frame',
+            'frames_recorded': self.frames_recorded,
+            'frames_dropped': self.frames_dropped,
+            'dropped_frames': self.dropped_frames,
+        }
+        with open(os.path.join(self.directory, 'session.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        log = logging.warning if self.frames_dropped else logging.info
+        log(f"Lidar recording finished: {self.frames_recorded} sweeps, {self.frames_dropped} dropped ({self.directory})")
+
+# +------------------------------------------------------------------------------+
+# | VideoRecorder Class                                                          |
+# +------------------------------------------------------------------------------+
+class VideoRecorder(object):
+    """
+    Streams frames (the composited display or the raw camera) into an ffmpeg subprocess for
+    session review videos. Frames are sampled at `fps` slots (wall clock for the display, simulation
+    time for camera frames, so unpaced headless runs still give real-time video) and handed to a writer thread
+    through a small bounded queue. When the encoder falls behind, frames are skipped so the caller
+    never waits. Gaps are filled by repeating the previous frame so playback keeps real-time pacing.
+    ffmpeg starts lazily on the first frame, whose size fixes the video size. When the frame size changes
+    (auto render scale, sensor switch) the file is closed and recording continues in a numbered segment.
+    """
+    def __init__(self, path, fps=30, ffmpeg='ffmpeg', hud=None, queue_frames=VIDEO_QUEUE_FRAMES):
+        self.path = path
+        self.fps = fps
+        self.ffmpeg = ffmpeg
+        self.hud = hud
+        self._period = 1.0 / fps
+        self._queue = queue.Queue(maxsize=queue_frames)
+        self._proc = None
+        self._thread = None
+        self._size = None
+        self._start_time = None
+        self._last_slot = -1
+        self.segments = [] # Files written so far, one per frame size
+        self.failed = False
+        self.frames_written = 0
+        self.frames_repeated = 0
+        self.frames_skipped = 0
+
+    def due(self, timestamp=None):
+        """True when the next frame slot has started; lets callers skip the capture copy otherwise."""
+        if self.failed:
+            return False
+        if self._start_time is None:
+            return True
+        now = time.perf_counter() if timestamp is None else timestamp
+        return int((now - self._start_time) / self._period) > self._last_slot
+
+    def capture_surface(self, surface):
+        if not self.due():
+            return
+        width, height = surface.get_size()
+        if surface.get_bitsize() == 32 and surface.get_masks()[:3] == BGRA_MASKS[:3] and surface.get_pitch() == width * 4:
+            data = bytes(surface.get_view('1')) # Same memory layout as bgra, a straight copy
+        else:
+            to_bytes = getattr(pygame.image, 'tobytes', None) or pygame.image.tostring # tobytes needs pygame >= 2.1.3
+            data = to_bytes(surface, 'BGRA')
+        self.submit(data, (width, height))
+
+    def submit(self, data, size, timestamp=None):
+        now = time.perf_counter() if timestamp is None else timestamp
+        if self._start_time is None:
+            self._start_time = now
+        slot = int((now - self._start_time) / self._period)
+        if slot <= self._last_slot or self.failed:
+            return
+        self._last_slot = slot
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='VideoRecorder', daemon=True)
+            self._thread.start()
+        if self._size is not None and size != self._size:
+            # e.g. the auto render scale or a sensor switch changed the camera resolution; the writer starts the new file
+            logging.info(f"VideoRecorder: frame size changed to {size[0]}x{size[1]}, starting a new segment")
+            if self.hud: self.hud.notification(f"Video continues in a new file at {size[0]}x{size[1]}")
+        self._size = size
+        try:
+            self._queue.put_nowait((slot, data, size))
+        except queue.Full:
+            self.frames_skipped += 1
+
+    def _open_segment(self, size):
+        """Closes the current encoder and starts one for `size`: self.path first, then <name>_001<ext>, ..."""
+        self._close_encoder()
+        root, ext = os.path.splitext(self.path)
+        path = '%s_%03d%s' % (root, len(self.segments), ext) if self.segments else self.path
+        command = [self.ffmpeg, '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgra', '-s', '%dx%d' % size, '-r', str(self.fps), '-i', '-',
+                   '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', path]
+        try:
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._proc = subprocess.Popen(command, stdin=subprocess.PIPE)
+        except OSError as e:
+            logging.error(f"VideoRecorder: could not start '{self.ffmpeg}': {e}")
+            if self.hud: self.hud.error("Video encoder unavailable")
+            self.failed = True
+            return False
+        self.segments.append(path)
+        logging.info(f"Recording video {size[0]}x{size[1]} @ {self.fps} FPS to {path}")
+        return True
+
+    def _close_encoder(self, timeout=30.0):
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logging.error(f"VideoRecorder: encoder did not finish cleanly: {e}")
+            self._proc.kill()
+        self._proc = None
+
+    def _run(self):
+        size, last_slot, last_data = None, None, None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                slot, data, frame_size = item
+                if frame_size != size:
+                    if not self._open_segment(frame_size):
+                        return
+                    size, last_data = frame_size, None # Gaps are not filled across segments
+                if last_data is not None:
+                    for _ in range(min(slot - last_slot - 1, self.fps)): # Cap repeats at one second
+                        self._proc.stdin.write(last_data)
+                        self.frames_repeated += 1
+                self._proc.stdin.write(data)
+                self.frames_written += 1
+                last_slot, last_data = slot, data
+        except OSError as e: # BrokenPipeError when ffmpeg exits
+            logging.error(f"VideoRecorder: encoder stopped accepting frames: {e}")
+            self.failed = True
+
+    def close(self, timeout=30.0):
+        if self._thread is None:
+            return
+        self.failed = True # No new frames
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self._close_encoder(timeout)
+        logging.info(f"Video saved to {', '.join(self.segments) or '(nothing)'}: {self.frames_written} frames, "
+                     f"{self.frames_repeated} repeated, {self.frames_skipped} skipped")
+        self._thread = None
+
+# +------------------------------------------------------------------------------+
+# | ImageWorker Class                                                            |
+# +------------------------------------------------------------------------------+
+class ImageWorker(object):
+    """
+    Runs CameraManager._parse_image off the CARLA callback thread. The callback only stores the
+    frame reference in a DoubleBuffer; if the worker falls behind, stale frames are skipped.
+    """
+    def __init__(self, camera_manager):
+        self._weak_manager = weakref.ref(camera_manager)
+        self._buffer = DoubleBuffer()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ImageWorker', daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        self._buffer.publish(image)
+
+    @property
+    def dropped(self):
+        return self._buffer.published - self._buffer.consumed
+
+    def _run(self):
+        while not self._stop_event.is_set() and self._weak_manager() is not None:
+            image = self._buffer.wait_latest(timeout=0.1)
+            if image is None:
+                continue
+            try:
+                CameraManager._parse_image(self._weak_manager, image)
+            except Exception as e:
+                logging.error(f"ImageWorker: error converting frame {getattr(image, 'frame', '?')}: {e}")
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        logging.debug(f"ImageWorker stopped ({self.dropped} stale frames skipped).")
+
+# +------------------------------------------------------------------------------+
+# | Synchronous Mode Classes                                                     |
+# +------------------------------------------------------------------------------+
+class SensorFrameQueue(object):
+    """FIFO of sensor data filled from the CARLA callback thread and read by frame number on the main thread."""
+    def __init__(self, name):
+        self.name = name
+        self._queue = queue.Queue()
+        self._pending = None # (data, arrival) read past the requested frame, kept for the next tick
+
+    def put(self, data):
+        self._queue.put((data, time.perf_counter())) # Arrival time, for latency measured from the callback
+
+    def clear(self):
+        self._pending = None
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _next(self, timeout=None):
+        if self._pending is not None:
+            item, self._pending = self._pending, None
+            return item
+        if timeout is None:
+            return self._queue.get_nowait()
+        return self._queue.get(timeout=timeout)
+
+    def get_frame(self, frame, timeout):
+        """Blocks until the data for `frame` arrives, discarding stale frames. Returns None on timeout."""
+        try:
+            while True:
+                item = self._next(timeout)
+                data = item[0]
+                if data.frame == frame:
+                    return data
+                if data.frame > frame:
+                    self._pending = item
+                    return None
+        except queue.Empty:
+            logging.warning(f"SensorFrameQueue '{self.name}': no data for frame {frame} after {timeout:.2f}s")
+            return None
+
+    def drain_until(self, frame, with_arrival=False):
+        """
+        Returns all queued events with event.frame <= `frame` without blocking, as
+        (event, time.perf_counter() at arrival) pairs if `with_arrival` is set.
+        """
+        events = []
+        try:
+            while True:
+                item = self._next()
+                if item[0].frame > frame:
+                    self._pending = item
+                    break
+                events.append(item if with_arrival else item[0])
+        except queue.Empty:
+            pass
+        return events
+
+
+class CarlaSyncMode(object):
+    """
+    Runs the server in synchronous fixed-step mode with the client driving world.tick().
+    Every tick returns the WorldSnapshot plus the camera image and collision/lane events
+    produced for that same snapshot frame (events as (event, arrival time) pairs).
+    """
+    def __init__(self, client, carla_world, fixed_delta_seconds=0.05, timeout=2.0):
+        self.client = client
+        self.world = carla_world
+        self.fixed_delta_seconds = fixed_delta_seconds
+        self.timeout = timeout
+        self.frame = None
+        self._original_settings = None
+        self._traffic_manager = None
+        self._on_tick_id = None
+        self._queues = {}
+        self._snapshot_queue = self.queue('snapshot')
+
+    def queue(self, name):
+        if name not in self._queues:
+            self._queues[name] = SensorFrameQueue(name)
+        return self._queues[name]
+
+    def enable(self):
+        self._original_settings = self.world.get_settings()
+        settings = self.world.get_settings()
+        settings.synchronous_mode = True
+        settings.fixed_delta_seconds = self.fixed_delta_seconds
+        self.frame = self.world.apply_settings(settings)
+        # Autopilot vehicles are driven by the Traffic Manager, which must step with the server
+        self._traffic_manager = self.client.get_trafficmanager()
+        self._traffic_manager.set_synchronous_mode(True)
+        self._on_tick_id = self.world.on_tick(self._snapshot_queue.put)
+        logging.info(f"Synchronous mode enabled (fixed_delta_seconds={self.fixed_delta_seconds})")
+        return self
+
+    def tick(self):
+        self.frame = self.world.tick()
+        return {
+            'snapshot': self._snapshot_queue.get_frame(self.frame, self.timeout),
+            'camera': self.queue('camera').get_frame(self.frame, self.timeout),
+            'collision': self.queue('collision').drain_until(self.frame, with_arrival=True),
+            'lane_invasion': self.queue('lane_invasion').drain_until(self.frame, with_arrival=True),
+        }
+
+    def disable(self):
+        if self._on_tick_id is not None:
+            self.world.remove_on_tick(self._on_tick_id)
+            self._on_tick_id = None
+        if self._traffic_manager is not None:
+            self._traffic_manager.set_synchronous_mode(False)
+        if self._original_settings is not None:
+            self.world.apply_settings(self._original_settings)
+            self._original_settings = None
+            logging.info("Synchronous mode disabled, original world settings restored.")
+
+# +------------------------------------------------------------------------------+
+# | Sensor Rig Classes                                                           |
+# +------------------------------------------------------------------------------+
+RIG_BLUEPRINTS = {
+    'rgb': 'sensor.camera.rgb',
+    'depth': 'sensor.camera.depth',
+    'seg': 'sensor.camera.semantic_segmentation',
+    'lidar': 'sensor.lidar.ray_cast',
+}
+RigStream = collections.namedtuple('RigStream', ['name', 'blueprint', 'size', 'sensor_tick'])
+# samples maps stream name -> carla.Image / carla.LidarMeasurement for the streams that fired on `frame`;
+# missing lists streams that had not reported past `frame` when the bundle was given up on
+RigBundle = collections.namedtuple('RigBundle', ['frame', 'timestamp', 'samples', 'missing'])
+
+
+def parse_rig_stream(spec, default_size):
+    """Parses NAME[:WIDTHxHEIGHT][@SENSOR_TICK], e.g. 'rgb', 'depth:640x360' or 'lidar@0.1'."""
+    spec, _, tick = spec.partition('@')
+    name, _, size = spec.partition(':')
+    if name not in RIG_BLUEPRINTS:
+        raise ValueError(f"unknown stream '{name}', expected one of {', '.join(RIG_BLUEPRINTS)}")
+    size = tuple(int(x) for x in size.split('x')) if size else tuple(default_size)
+    tick = float(tick) if tick else 0.0
+    if len(size) != 2 or min(size) < 1 or tick < 0:
+        raise ValueError(f"invalid size or sensor tick in '{spec}'")
+    return RigStream(name, RIG_BLUEPRINTS[name], size, tick)
+
+
+class SensorRig(object):
+    """
+    Multi-stream capture rig for synchronous mode: RGB, depth, segmentation and lidar sensors sharing one
+    mount, each with its own resolution and sensor_tick. Raw measurements are joined by frame number into
+    one RigBundle per world tick and handed to the consumers. Nothing here is converted for display.
+
+    Streams ticking every frame are waited for like the display camera. Streams with a sensor_tick are
+    read without blocking, and a frame's bundle is released once every stream has reported at or past
+    that frame, so bundles can trail the simulation by up to the longest sensor_tick.
+    """
+    MOUNT = carla.Transform(carla.Location(x=1.5, z=2.4)) # Shared by all streams so the views stay pixel-aligned
+
+    def __init__(self, parent_actor, streams, sync_mode, fov=90.0, consumers=()):
+        self.streams = list(streams)
+        self.consumers = list(consumers)
+        self.latest_bundle = None
+        self.bundles_released = 0
+        self.bundles_incomplete = 0
+        self._sync_mode = sync_mode
+        self._pending = collections.OrderedDict() # frame -> (timestamp, samples), oldest first
+        self._reported = {} # stream name -> newest frame received
+        longest_tick = max([stream.sensor_tick for stream in self.streams] + [0.0])
+        self._max_pending = int(math.ceil(longest_tick / sync_mode.fixed_delta_seconds)) + 2
+        self.sensors = {}
+        self._queues = {}
+        world = parent_actor.get_world()
+        bp_library = world.get_blueprint_library()
+        for stream in self.streams:
+            bp = bp_library.find(stream.blueprint)
+            bp.set_attribute('sensor_tick', str(stream.sensor_tick))
+            if stream.name == 'lidar':
+                if bp.has_attribute('range'): bp.set_attribute('range', str(LIDAR_RANGE))
+                # One full revolution per measurement
+                if bp.has_attribute('rotation_frequency'):
+                    bp.set_attribute('rotation_frequency', str(1.0 / (stream.sensor_tick or sync_mode.fixed_delta_seconds)))
+            else:
+                bp.set_attribute('image_size_x', str(stream.size[0]))
+                bp.set_attribute('image_size_y', str(stream.size[1]))
+                if bp.has_attribute('fov'): bp.set_attribute('fov', str(fov))
+            frame_queue = sync_mode.queue('rig_' + stream.name)
+            frame_queue.clear()
+            self._queues[stream.name] = frame_queue
+            try:
+                sensor = world.spawn_actor(bp, self.MOUNT, attach_to=parent_actor)
+            except RuntimeError as e:
+                logging.error(f"SensorRig: failed to spawn {stream.name} ({stream.blueprint}): {e}")
+                continue
+            sensor.listen(frame_queue.put)
+            self.sensors[stream.name] = sensor
+        self.streams = [stream for stream in self.streams if stream.name in self.sensors]
+        logging.info("Sensor rig: " + ', '.join(
+            f"{s.name} {'' if s.name == 'lidar' else '%dx%d ' % s.size}@ {s.sensor_tick or 'every tick'}" for s in self.streams))
+
+    def collect(self, snapshot):
+        """Joins the measurements received so far for the tick `snapshot`; returns the bundles released by it."""
+        if snapshot is None or not self.streams:
+            return []
+        frame = snapshot.frame
+        self._pending[frame] = (snapshot.timestamp.elapsed_seconds, {})
+        self._receive(frame, wait=True)
+        return self._release()
+
+    def _receive(self, frame, wait):
+        for stream in self.streams:
+            frame_queue = self._queues[stream.name]
+            samples = frame_queue.drain_until(frame)
+            if wait and stream.sensor_tick == 0 and self._reported.get(stream.name, -1) < frame and \
+                    not any(sample.frame == frame for sample in samples):
+                sample = frame_queue.get_frame(frame, self._sync_mode.timeout)
+                if sample is not None:
+                    samples.append(sample)
+            for sample in samples:
+                pending = self._pending.get(sample.frame)
+                if pending is not None:
+                    pending[1][stream.name] = sample
+                self._reported[stream.name] = max(self._reported.get(stream.name, -1), sample.frame)
+
+    def _release(self, flush=False):
+        settled = min(self._reported.get(stream.name, -1) for stream in self.streams)
+        released = []
+        while self._pending:
+            oldest = next(iter(self._pending))
+            if not flush and oldest > settled and len(self._pending) <= self._max_pending:
+                break
+            timestamp, samples = self._pending.pop(oldest)
+            missing = [s.name for s in self.streams if self._reported.get(s.name, -1) < oldest]
+            released.append(RigBundle(oldest, timestamp, samples, missing))
+        for bundle in released:
+            self.bundles_released += 1
+            if bundle.missing:
+                self.bundles_incomplete += 1
+                logging.warning(f"SensorRig: frame {bundle.frame} released without {', '.join(bundle.missing)}")
+            self.latest_bundle = bundle
+            for consumer in self.consumers:
+                consumer(bundle)
+        return released
+
+    def destroy(self):
+        for sensor in self.sensors.values():
+            sensor.stop()
+            sensor.destroy()
+        self.sensors = {}
+        if self._pending:
+            # Whatever arrived for the last ticks is still released, streams not heard from are listed as missing
+            self._receive(next(reversed(self._pending)), wait=False)
+            self._release(flush=True)
+        logging.info(f"Sensor rig stopped ({self.bundles_released} bundles, {self.bundles_incomplete} incomplete).")
+
+
+class RigWriter(object):
+    """
+    SensorRig consumer writing a dataset directory: camera streams go through a FrameRecorder each
+    (<stream>/chunk_NNNNN.frames.npy), lidar sweeps through a LidarRecorder (lidar/<frame>.npy), so only
+    bundles.csv, which lists per bundle which frame each stream contributed, is written on the main thread.
+    """
+    def __init__(self, directory, streams, hud=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.stream_names = [stream.name for stream in streams]
+        self._recorders = {stream.name: FrameRecorder(os.path.join(directory, stream.name), hud, workers=1)
+                           for stream in streams if stream.name != 'lidar'}
+        self._lidar = LidarRecorder(os.path.join(directory, 'lidar'), hud) if 'lidar' in self.stream_names else None
+        self._index_file = open(os.path.join(directory, 'bundles.csv'), 'w', newline='')
+        self._index = csv.writer(self._index_file)
+        self._index.writerow(['frame', 'timestamp'] + self.stream_names + ['missing'])
+
+    def __call__(self, bundle):
+        for name, sample in bundle.samples.items():
+            if name in self._recorders:
+                self._recorders[name].add(sample)
+            else:
+                self._lidar.add(sample)
+        self._index.writerow([bundle.frame, f"{bundle.timestamp:.6f}"] +
+                             [bundle.samples[name].frame if name in bundle.samples else '' for name in self.stream_names] +
+                             [' '.join(bundle.missing)])
+
+    def close(self):
+        for recorder in self._recorders.values():
+            recorder.stop()
+        if self._lidar is not None:
+            self._lidar.stop()
+        self._index_file.close()
+        logging.info(f"Rig dataset written to {self.directory}")
+
+# +------------------------------------------------------------------------------+
+# | Render Thread Classes                                                        |
+# +------------------------------------------------------------------------------+
+RenderFrame = collections.namedtuple('RenderFrame', ['camera_surface', 'camera_pool', 'hud_state'])
+
+
+class DoubleBuffer(object):
+    """Two-slot handoff: the producer fills the back slot and swaps, the consumer always takes the newest front slot."""
+    def __init__(self):
+        self._slots = [None, None]
+        self._front = 0
+        self._front_taken = True
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.published = 0
+        self.consumed = 0
+
+    def publish(self, item):
+        """Returns the previous item if the consumer never took it (it never will), else None."""
+        back = 1 - self._front
+        self._slots[back] = item
+        with self._lock:
+            superseded = None if self._front_taken else self._slots[self._front]
+            self._front, self._front_taken = back, False
+            self.published += 1
+        self._ready.set()
+        return superseded
+
+    def wait_latest(self, timeout):
+        """Returns the newest published item, or None if nothing new arrived within `timeout` seconds."""
+        if not self._ready.wait(timeout):
+            return None
+        with self._lock:
+            self._ready.clear()
+            self.consumed += 1
+            self._front_taken = True
+            return self._slots[self._front]
+
+
+class RenderThread(object):
+    """
+    Composites World.render() and flips the display on its own thread so a long blit or flip
+    never delays DualControl.parse_events / apply_control on the main thread.
+    The window itself is still created (and its events pumped) on the main thread, as SDL requires.
+    """
+    def __init__(self, world, display, video_sink=None):
+        self._world = world
+        self._display = display
+        self._video_sink = video_sink
+        self._buffer = DoubleBuffer()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='RenderThread', daemon=True)
+        self.error = None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, frame):
+        if self.error is not None:
+            raise RuntimeError(f"Render thread failed: {self.error}") from self.error
+        superseded = self._buffer.publish(frame)
+        if superseded is not None:
+            self._release(superseded)
+
+    @staticmethod
+    def _release(frame):
+        if frame.camera_surface is not None:
+            frame.camera_pool.release(frame.camera_surface)
+
+    def _run(self):
+        try:
+            while not self._stop_event.is_set():
+                frame = self._buffer.wait_latest(timeout=0.1)
+                if frame is None:
+                    continue
+                try:
+                    self._world.render(self._display, frame)
+                finally:
+                    self._release(frame)
+                if self._video_sink is not None:
+                    self._video_sink.capture_surface(self._display)
+                with self._world.hud.profiler.measure('flip'):
+                    pygame.display.flip()
+        except Exception as e:
+            logging.error(f"Render thread stopped: {e}", exc_info=True)
+            self.error = e
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        skipped = self._buffer.published - self._buffer.consumed
+        logging.info(f"Render thread stopped ({self._buffer.consumed} frames rendered, {skipped} superseded).")
+
+# +------------------------------------------------------------------------------+
+# | RenderScaleController Class                                                  |
+# +------------------------------------------------------------------------------+
+class RenderScaleController(object):
+    """
+    Dynamic render scale for --render-scale auto. Steps the camera resolution down while the
+    measured frame time misses the target, and back up when there is clear headroom. That is the
+    server frame time in asynchronous mode, and the unpaced loop time (including the blocking
+    world tick) in synchronous mode, where the target is the fixed step.
+    Every change respawns the camera, so decisions use the median of the last `window` frames at the
+    current scale (a few slow frames, including the respawn hitch itself, never move it), there is a
+    band between stepping down (1.1x target) and up (0.75x), and a cooldown follows every change.
+    """
+    LEVELS = (1.0, 0.85, 0.75, 0.67, 0.5)
+
+    def __init__(self, target_fps=60, cooldown_seconds=5.0, start_scale=1.0, window=60, clock=time.monotonic):
+        self.target_frame_time = 1.0 / target_fps
+        self.cooldown_seconds = cooldown_seconds
+        self._index = min(range(len(self.LEVELS)), key=lambda i: abs(self.LEVELS[i] - start_scale))
+        self._frame_times = collections.deque(maxlen=window)
+        self._clock = clock
+        self._last_change = clock()
+
+    @property
+    def scale(self):
+        return self.LEVELS[self._index]
+
+    def update(self, frame_time):
+        """Takes the latest frame time in seconds, returns the new scale when it should change, else None."""
+        if not frame_time:
+            return None
+        self._frame_times.append(frame_time)
+        if len(self._frame_times) < self._frame_times.maxlen or self._clock() - self._last_change < self.cooldown_seconds:
+            return None
+        typical = float(np.median(self._frame_times))
+        if typical > self.target_frame_time * 1.1 and self._index < len(self.LEVELS) - 1:
+            self._index += 1
+        elif typical < self.target_frame_time * 0.75 and self._index > 0:
+            self._index -= 1
+        else:
+            return None
+        self._last_change = self._clock()
+        self._frame_times.clear() # The next decision only sees frames rendered at the new scale
+        return self.scale
+
+# +------------------------------------------------------------------------------+
+# | Frame Scheduler                                                              |
+# +------------------------------------------------------------------------------+
+class FrameScheduler(object):
+    """
+    Low-CPU replacement for Clock.tick_busy_loop(): sleeps until shortly before the frame deadline
+    and only spins for the remainder. The spin margin follows the measured sleep overshoot, and in
+    adaptive mode the target rate follows the server FPS so frames are not rendered twice.
+    """
+    def __init__(self, target_fps=60, min_fps=20, adaptive=True, spin_seconds=0.002):
+        self.max_fps = target_fps
+        self.min_fps = min(min_fps, target_fps) if target_fps else 0
+        self.adaptive = adaptive
+        self.fps = float(target_fps)
+        self._spin = spin_seconds
+        self._deadline = None
+        self._returned = None
+        self.busy_seconds = 0.0 # Time between the previous wait() returning and this one starting, i.e. unpaced frame time
+
+    def _update_rate(self, server_fps):
+        if not self.adaptive or not server_fps or not self.max_fps:
+            return
+        wanted = max(self.min_fps, min(self.max_fps, server_fps))
+        self.fps += 0.1 * (wanted - self.fps) # Smoothed, HUD.server_fps jitters tick to tick
+
+    def wait(self, server_fps=None):
+        self._update_rate(server_fps)
+        now = time.perf_counter()
+        if self._returned is not None:
+            self.busy_seconds = now - self._returned
+        if self.fps <= 0: # Unpaced
+            self._deadline = self._returned = now
+            return
+        period = 1.0 / self.fps
+        if self._deadline is None or now - self._deadline > period:
+            self._deadline = self._returned = now # Running late: restart the cadence instead of bursting to catch up
+            return
+        self._deadline += period
+        sleep_for = self._deadline - now - self._spin
+        if sleep_for > 0:
+            time.sleep(sleep_for)
+            overshoot = time.perf_counter() - (now + sleep_for)
+            # Keep the spin margin just above the OS sleep overshoot (about 1-2 ms on Linux, up to ~15 ms on older Windows Pythons)
+            self._spin = min(0.016, max(0.0005, 0.9 * self._spin + 0.1 * 1.5 * overshoot))
+        while time.perf_counter() < self._deadline:
+            pass
+        self._returned = time.perf_counter()
+
+# +------------------------------------------------------------------------------+
+# | Stand-in World Classes                                                       |
+# +------------------------------------------------------------------------------+
+# A local stand-in for carla.Client / carla.World (--stand-in), so --headless runs and their tests need no
+# CARLA server. It implements only what this script calls: blueprints, spawning, synchronous ticks with
+# snapshots and on_tick callbacks, and sensors whose listen() callbacks get blank camera images and empty
+# lidar sweeps. Nothing moves and no collision or lane events are generated. The world only advances on
+# tick(), so --stand-in implies --sync.
+StandInTimestamp = collections.namedtuple('StandInTimestamp', ['frame', 'elapsed_seconds', 'delta_seconds', 'platform_timestamp'])
+StandInImage = collections.namedtuple('StandInImage', ['frame', 'timestamp', 'width', 'height', 'fov', 'raw_data'])
+StandInLidarMeasurement = collections.namedtuple('StandInLidarMeasurement', ['frame', 'timestamp', 'channels', 'raw_data'])
+StandInPhysicsControl = collections.namedtuple('StandInPhysicsControl', ['max_rpm'])
+StandInAttribute = collections.namedtuple('StandInAttribute', ['id', 'recommended_values'])
+
+
+class StandInSnapshot(object):
+    def __init__(self, frame, elapsed_seconds, delta_seconds):
+        self.frame = frame
+        self.elapsed_seconds = elapsed_seconds
+        self.timestamp = StandInTimestamp(frame, elapsed_seconds, delta_seconds, time.time())
+
+    def find(self, actor_id):
+        return None # Callers fall back to the actor's own getters
+
+
+class StandInSettings(object):
+    def __init__(self, synchronous_mode=False, fixed_delta_seconds=None, no_rendering_mode=False):
+        self.synchronous_mode = synchronous_mode
+        self.fixed_delta_seconds = fixed_delta_seconds
+        self.no_rendering_mode = no_rendering_mode
+
+
+class StandInBlueprint(object):
+    def __init__(self, blueprint_id):
+        self.id = blueprint_id
+        self.attributes = {}
+
+    def has_attribute(self, name):
+        return True
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def get_attribute(self, name):
+        return StandInAttribute(name, [self.attributes.get(name, '0,0,0')])
+
+
+class StandInBlueprintLibrary(object):
+    def find(self, blueprint_id):
+        return StandInBlueprint(blueprint_id)
+
+    def filter(self, pattern):
+        return [StandInBlueprint('vehicle.standin.car')]
+
+
+class StandInMap(object):
+    name = 'StandIn'
+
+    def get_spawn_points(self):
+        return [carla.Transform(carla.Location(z=0.5))]
+
+    def get_waypoint(self, location, project_to_road=True, lane_type=None):
+        return None # Lane violations are scored as unknown
+
+    def generate_waypoints(self, distance):
+        return []
+
+
+class _StandInActorBase(object):
+    """Shared actor behaviour. The properties shadow the read-only ones of carla.Actor in StandInVehicle."""
+    def _init_actor(self, world, blueprint, transform, parent):
+        self._world = world
+        self._id = next(world._actor_ids)
+        self._type_id = blueprint.id
+        self._attributes = dict(blueprint.attributes)
+        self._transform = transform
+        self._parent = parent
+        self._callback = None
+        self._last_data_time = None
+
+    id = property(lambda self: self._id)
+    type_id = property(lambda self: self._type_id)
+    attributes = property(lambda self: self._attributes)
+    parent = property(lambda self: self._parent)
+
+    def get_world(self):
+        return self._world
+
+    def get_transform(self):
+        return self._parent.get_transform() if self._parent is not None else self._transform
+
+    def set_transform(self, transform):
+        self._transform = transform
+
+    def get_velocity(self):
+        return carla.Vector3D()
+
+    def listen(self, callback):
+        self._callback = callback
+
+    def stop(self):
+        self._callback = None
+
+    def destroy(self):
+        self._callback = None
+        return self._world._actors.pop(self._id, None) is not None
+
+    def _emit(self, frame, elapsed_seconds):
+        # Sensor data for this tick, honouring sensor_tick like the server does
+        sensor_tick = float(self._attributes.get('sensor_tick', 0) or 0)
+        if sensor_tick and self._last_data_time is not None and elapsed_seconds - self._last_data_time < sensor_tick - 1e-6:
+            return
+        self._last_data_time = elapsed_seconds
+        if self._type_id.startswith('sensor.camera'):
+            size = (int(self._attributes.get('image_size_x', 800)), int(self._attributes.get('image_size_y', 600)))
+            data = StandInImage(frame, elapsed_seconds, size[0], size[1], float(self._attributes.get('fov', 90)),
+                                self._world._blank_image(size))
+        else:
+            data = StandInLidarMeasurement(frame, elapsed_seconds, 32, b'')
+        self._callback(data)
+
+
+class StandInActor(_StandInActorBase):
+    def __init__(self, world, blueprint, transform, parent=None):
+        self._init_actor(world, blueprint, transform, parent)
+
+
+class StandInVehicle(_StandInActorBase, carla.Vehicle):
+    """
+    Derives from carla.Vehicle so the isinstance() checks in World and DualControl hold;
+    carla.Vehicle.__init__ (not constructible from Python) is never called.
+    """
+    def __init__(self, world, blueprint, transform, parent=None):
+        self._init_actor(world, blueprint, transform, parent)
+        self._control = carla.VehicleControl()
+        self.autopilot = False
+
+    def set_autopilot(self, enabled=True, tm_port=None):
+        self.autopilot = enabled
+
+    def get_control(self):
+        return self._control
+
+    def apply_control(self, control):
+        self._control = control
+
+    def get_physics_control(self):
+        return StandInPhysicsControl(max_rpm=5000.0)
+
+
+class StandInWorld(object):
+    def __init__(self):
+        self._settings = StandInSettings()
+        self._map = StandInMap()
+        self._actors = collections.OrderedDict()
+        self._actor_ids = itertools.count(1)
+        self._tick_callbacks = {}
+        self._callback_ids = itertools.count(1)
+        self._blank_images = {}
+        self.frame = 0
+        self.elapsed_seconds = 0.0
+
+    def get_settings(self):
+        settings = self._settings
+        return StandInSettings(settings.synchronous_mode, settings.fixed_delta_seconds, settings.no_rendering_mode)
+
+    def apply_settings(self, settings):
+        self._settings = StandInSettings(settings.synchronous_mode, settings.fixed_delta_seconds, settings.no_rendering_mode)
+        return self.frame
+
+    def get_map(self):
+        return self._map
+
+    def get_blueprint_library(self):
+        return StandInBlueprintLibrary()
+
+    def get_spectator(self):
+        return StandInActor(self, StandInBlueprint('spectator'), carla.Transform())
+
+    def set_weather(self, weather):
+        pass
+
+    def spawn_actor(self, blueprint, transform, attach_to=None):
+        actor_class = StandInVehicle if blueprint.id.startswith('vehicle.') else StandInActor
+        actor = actor_class(self, blueprint, transform, attach_to)
+        self._actors[actor.id] = actor
+        return actor
+
+    def try_spawn_actor(self, blueprint, transform):
+        return self.spawn_actor(blueprint, transform)
+
+    def on_tick(self, callback):
+        callback_id = next(self._callback_ids)
+        self._tick_callbacks[callback_id] = callback
+        return callback_id
+
+    def remove_on_tick(self, callback_id):
+        self._tick_callbacks.pop(callback_id, None)
+
+    def get_snapshot(self):
+        return StandInSnapshot(self.frame, self.elapsed_seconds, self._settings.fixed_delta_seconds or 0.0)
+
+    def tick(self, seconds=10.0):
+        delta_seconds = self._settings.fixed_delta_seconds or 0.05
+        self.frame += 1
+        self.elapsed_seconds += delta_seconds
+        snapshot = self.get_snapshot()
+        for callback in list(self._tick_callbacks.values()):
+            callback(snapshot)
+        for actor in list(self._actors.values()):
+            if actor._callback is not None and actor.type_id.startswith(('sensor.camera', 'sensor.lidar')):
+                actor._emit(self.frame, self.elapsed_seconds)
+        return self.frame
+
+    def wait_for_tick(self, seconds=10.0):
+        self.tick(seconds)
+        return self.get_snapshot()
+
+    def _blank_image(self, size):
+        if size not in self._blank_images:
+            self._blank_images[size] = bytes(size[0] * size[1] * 4)
+        return self._blank_images[size]
+
+
+class StandInTrafficManager(object):
+    def set_synchronous_mode(self, enabled):
+        pass
+
+
+class StandInClient(object):
+    def __init__(self, world=None):
+        self._world = world if world is not None else StandInWorld()
+
+    def set_timeout(self, seconds):
+        pass
+
+    def get_world(self):
+        return self._world
+
+    def get_trafficmanager(self, port=8000):
+        return StandInTrafficManager()
+
+    def apply_batch(self, commands):
+        pass # Only the spectator is moved through batches, and nobody sees it
+
 # +------------------------------------------------------------------------------+
 # | Game Loop Function                                                           |
 # +------------------------------------------------------------------------------+
-def game_loop(args):
+def game_loop(args, client=None):
+    """
+    Runs the client. `client` may be any object exposing get_world()/get_trafficmanager() like carla.Client,
+    which lets --headless runs be driven by a local stand-in world instead of a CARLA server.
+    """
+    if args.headless:
+        # SDL reads these at pygame.init(); setdefault keeps any driver the caller chose explicitly
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    AlertAudio.pre_init(args.audio_buffer) # ADDED: Before pygame.init() opens the audio device
     pygame.init()
     pygame.font.init()
     world = None 
     hud = None 
+    sync_mode = None
+    renderer = None
+    display = None
+    video = None
+    rig_writer = None
     try:
-        client = carla.Client(args.host, args.port)
-        client.set_timeout(300.0) 
-
-        display_info = pygame.display.Info()
-        native_width = display_info.current_w
-        native_height = display_info.current_h
+        if client is None:
+            client = StandInClient() if args.stand_in else carla.Client(args.host, args.port) # MODIFIED: --stand-in
+            client.set_timeout(300.0) 
+
+        if args.headless:
+            # No window at all; cameras use --res and the HUD only keeps score and logs notifications
+            native_width, native_height = args.width, args.height
+            print(f"Headless mode: no display, camera resolution {native_width}x{native_height}")
+        else:
+            display_info = pygame.display.Info()
+            native_width = display_info.current_w
+            native_height = display_info.current_h
 
-        display_flags = pygame.HWSURFACE | pygame.DOUBLEBUF | pygame.FULLSCREEN 
-        
-        display = pygame.display.set_mode(
-            (native_width, native_height), 
-            display_flags)
+            display_flags = pygame.HWSURFACE | pygame.DOUBLEBUF | pygame.FULLSCREEN 
+            
+            display = pygame.display.set_mode(
+                (native_width, native_height), 
+                display_flags)
 
-        pygame.display.set_caption("CARLA Fanatec Simulation") 
-        print(f"Pygame Display Mode Set: Native Fullscreen: {native_width}x{native_height}")
+            pygame.display.set_caption("CARLA Fanatec Simulation") 
+            print(f"Pygame Display Mode Set: Native Fullscreen: {native_width}x{native_height}")
 
         hud = HUD(native_width, native_height, args) # Pass args to HUD
-        world = World(client.get_world(), hud, args.filter, args.fov) 
+        sim_world = client.get_world()
+        if args.sync:
+            sync_mode = CarlaSyncMode(client, sim_world, args.fixed_dt).enable()
+        # Nobody sees the spectator when this script launched the server with -RenderOffScreen
+        spectator_mode = args.spectator
+        if spectator_mode == 'auto':
+            spectator_mode = 'follow' if args.no_launch_carla else 'off'
+        spectator_follower = SpectatorFollower(client, sim_world, args.spectator_hz) if spectator_mode == 'follow' else None
+        if args.record_video:
+            video = VideoRecorder(args.record_video, args.record_video_fps, args.ffmpeg, hud)
+        video_source = args.record_video_source
+        if video and video_source == 'display' and args.headless:
+            logging.warning("No display in --headless mode, recording the raw camera stream instead.")
+            video_source = 'camera'
+        if args.rig and sync_mode:
+            rig_writer = RigWriter(args.rig_out or os.path.join(
+                '_out', 'rig_%s' % datetime.datetime.now().strftime('%Y%m%d_%H%M%S')), args.rig, hud)
+        # The fixed step is the frame time budget in synchronous mode, whatever --fps says
+        render_scale_controller = (RenderScaleController(1.0 / args.fixed_dt if sync_mode else args.fps)
+                                   if args.render_scale == 'auto' else None)
+        render_scale = render_scale_controller.scale if render_scale_controller else float(args.render_scale)
+        world = World(sim_world, hud, args.filter, args.fov, sync_mode=sync_mode, spectator_follower=spectator_follower,
+                      render_scale=render_scale, render_scale_controller=render_scale_controller,
+                      video_sink=video if video_source == 'camera' else None,
+                      rig_streams=args.rig, rig_consumers=[rig_writer] if rig_writer else [],
+                      warm_sensors=args.warm_sensors) 
         controller = DualControl(world, args.autopilot) 
 
+        # In synchronous mode the loop is paced to the fixed step so simulation time tracks wall time
+        # (the server FPS is then our own tick rate, so it cannot drive adaptation).
+        # Headless synchronous runs are unpaced (0 = no limit) for maximum throughput.
+        target_fps = int(round(1.0 / args.fixed_dt)) if sync_mode else args.fps
+        if args.headless and sync_mode:
+            target_fps = 0
+        scheduler = FrameScheduler(target_fps, adaptive=not (sync_mode or args.no_adaptive_fps))
+        if args.render_thread and not args.headless:
+            renderer = RenderThread(world, display, video if video_source == 'display' else None).start()
+
         clock = pygame.time.Clock()
+        frames = 0
         while True:
-            clock.tick_busy_loop(60) 
-            if controller.parse_events(world, clock): 
+            scheduler.wait(hud.server_fps)
+            clock.tick() # Measures the frame time only, pacing is done by the scheduler
+            with hud.profiler.measure('parse_events'):
+                quit_requested = controller.parse_events(world, clock)
+            if quit_requested: 
+                return
+            frames += 1
+            if args.max_frames and frames > args.max_frames:
+                logging.info(f"Reached --max-frames {args.max_frames}, stopping.")
                 return
             
-            if world: world.tick(clock) 
+            if sync_mode:
+                world.on_sync_frame(sync_mode.tick())
+            if world: world.tick(clock, scheduler.busy_seconds if sync_mode else None) 
+            if args.headless:
+                continue
+            if renderer:
+                renderer.submit(world.render_frame())
+                continue
             if world: world.render(display) 
+            if video and video_source == 'display':
+                video.capture_surface(display)
             
-            pygame.display.flip() 
+            with hud.profiler.measure('flip'):
+                pygame.display.flip() 
 
     except Exception as e: 
         logging.error(f"Critical error in game loop: {e}", exc_info=True)
+        if renderer is not None:
+            renderer.stop() # Display is only touched by one thread from here on
+            renderer = None
         if hud: hud.error(f"GAME LOOP CRASH: {type(e).__name__}") 
-        if 'display' in locals() and display and hud: 
+        if display and hud: 
             pygame.display.flip() 
             time.sleep(5) 
     finally:
+        if renderer is not None:
+            renderer.stop()
+        if world is not None and world.camera_manager is not None:
+            world.camera_manager.video_sink = None # Stop camera frames before the encoder pipe closes
+        if video is not None:
+            video.close()
+        if hud is not None:
+            logging.info(f"Session score: {hud.current_score} (collisions -{hud.total_points_lost_collisions}, "
+                         f"lane violations -{hud.total_points_lost_lane_violations})")
+            if hud.audio.enabled:
+                logging.info(f"Alert audio: median event-to-output latency {hud.audio.latency_ms():.1f} ms, "
+                             f"{hud.audio.dropped} sounds dropped (no free channel)")
+            try:
+                hud.profiler.export_csv(args.profile_csv or os.path.join(
+                    '_out', 'frame_profile_%s.csv' % datetime.datetime.now().strftime('%Y%m%d_%H%M%S')))
+            except OSError as e:
+                logging.error(f"Error exporting frame profile: {e}")
+        if world is not None and world.collision_history.total:
+            try:
+                world.collision_history.export(args.collision_export or os.path.join(
+                    '_out', 'collisions_%s.npy' % datetime.datetime.now().strftime('%Y%m%d_%H%M%S')))
+            except OSError as e:
+                logging.error(f"Error exporting collision history: {e}")
+        if sync_mode is not None:
+            sync_mode.disable() # Restore async settings first, otherwise the server stays frozen waiting for ticks
         if world is not None: 
             logging.info("Destroying world...")
             world.destroy()
             logging.info("World destroyed.")
+        if rig_writer is not None:
+            rig_writer.close() # After world.destroy(), which stops the rig sensors feeding it
+        load_font.cache_clear()
         pygame.quit()
         logging.info("Pygame quit.")
 
 # ==============================================================================
 # -- main() -- function --------------------------------------------------------
 # ==============================================================================
-def main():
+def parse_arguments(argv=None):
+    """Parses and validates the command line (sys.argv when `argv` is None)."""
     argparser = argparse.ArgumentParser(description='CARLA Manual Control Client')
     argparser.add_argument('-v', '--verbose', action='store_true', dest='debug', help='print debug information')
     argparser.add_argument('--host', metavar='H', default='localhost', help='IP of the host server (default: 127.0.0.1)')
@@ -1625,7 +4347,127 @@ def main():
         default=120.0, # MODIFIED: Default FOV to 120
         type=float,
         help='Horizontal field of view for the RGB camera (default: 120.0 degrees)')
-    args = argparser.parse_args()
+    argparser.add_argument(
+        '--sync',
+        action='store_true',
+        help='Run the server in synchronous mode, ticked by this client')
+    argparser.add_argument(
+        '--fixed-dt',
+        metavar='SECONDS',
+        default=0.05,
+        type=float,
+        help='Fixed simulation step used with --sync (default: 0.05, i.e. 20 Hz)')
+    argparser.add_argument(
+        '--render-thread',
+        action='store_true',
+        help='Composite and flip the display on a separate thread from input/control/simulation')
+    argparser.add_argument(
+        '--profile-csv',
+        metavar='PATH',
+        default=None,
+        help='CSV file for the per-phase frame profile written at shutdown (default: _out/frame_profile_<timestamp>.csv)')
+    argparser.add_argument(
+        '--collision-export',
+        metavar='PATH',
+        default=None,
+        help='File for the session collision history written at shutdown if any collision occurred, .npy or .csv '
+             '(default: _out/collisions_<timestamp>.npy)')
+    argparser.add_argument(
+        '--headless',
+        action='store_true',
+        help='Run without a display (SDL dummy driver, HUD compositor off); scoring, sensors and logging keep running')
+    argparser.add_argument(
+        '--stand-in',
+        action='store_true',
+        help='Run against a local stand-in world instead of a CARLA server (implies --sync and --no-launch-carla), e.g. to smoke-test --headless in CI')
+    argparser.add_argument(
+        '--max-frames',
+        metavar='N',
+        default=0,
+        type=int,
+        help='Stop after N client frames, e.g. for batch scoring runs (default: 0, run until quit)')
+    argparser.add_argument(
+        '--fps',
+        metavar='N',
+        default=60,
+        type=int,
+        help='Maximum client frame rate in asynchronous mode (default: 60)')
+    argparser.add_argument(
+        '--no-adaptive-fps',
+        action='store_true',
+        help='Always pace at --fps instead of following the measured server FPS')
+    argparser.add_argument(
+        '--spectator',
+        choices=['auto', 'follow', 'off'],
+        default='auto',
+        help='Spectator tracking of the driver seat; auto turns it off when this script launches the server with -RenderOffScreen (default: auto)')
+    argparser.add_argument(
+        '--spectator-hz',
+        metavar='HZ',
+        default=20.0,
+        type=float,
+        help='Spectator update rate when following, 0 = every tick (default: 20)')
+    argparser.add_argument(
+        '--render-scale',
+        metavar='SCALE',
+        default='1.0',
+        help='Camera resolution as a fraction of the display (e.g. 0.75), upscaled on the client; "auto" adapts it to the measured frame time (default: 1.0)')
+    argparser.add_argument(
+        '--record-video',
+        metavar='PATH',
+        default=None,
+        help='Encode the session to a video file with ffmpeg (e.g. _out/session.mp4)')
+    argparser.add_argument(
+        '--record-video-source',
+        choices=['display', 'camera'],
+        default='display',
+        help='Record the composited display (camera + HUD) or the raw camera stream (default: display)')
+    argparser.add_argument(
+        '--record-video-fps',
+        metavar='FPS',
+        default=30,
+        type=int,
+        help='Video frame rate; frames are sampled at this rate and skipped if the encoder falls behind (default: 30)')
+    argparser.add_argument(
+        '--ffmpeg',
+        metavar='PATH',
+        default='ffmpeg',
+        help='ffmpeg executable used by --record-video (default: ffmpeg on PATH)')
+    argparser.add_argument(
+        '--rig',
+        metavar='STREAM',
+        nargs='+',
+        default=[],
+        help='Capture a synchronized sensor rig for datasets; implies --sync. STREAM is NAME[:WIDTHxHEIGHT][@SENSOR_TICK] '
+             'with NAME one of rgb, depth, seg, lidar (e.g. --rig rgb depth:640x360 seg lidar@0.1; size defaults to --res)')
+    argparser.add_argument(
+        '--rig-out',
+        metavar='DIR',
+        default=None,
+        help='Dataset directory for --rig (default: _out/rig_<timestamp>)')
+    argparser.add_argument(
+        '--audio-buffer',
+        metavar='SAMPLES',
+        default=AUDIO_BUFFER_SAMPLES,
+        type=int,
+        help='Mixer buffer size for alert sounds; smaller is lower latency but may crackle (default: %d)' % AUDIO_BUFFER_SAMPLES)
+    argparser.add_argument(
+        '--warm-sensors',
+        metavar='N',
+        default=0,
+        type=int,
+        help='Keep the N sensors either side of the displayed one (N key order) spawned, so switching to them '
+             'is instant; each is a full-size sensor on the server (default: 0)')
+    argparser.add_argument(
+        '--benchmark-frame-path',
+        action='store_true',
+        help='Benchmark the camera frame conversion at --res and exit (no CARLA server needed)')
+    argparser.add_argument(
+        '--benchmark-lane-index',
+        metavar='XODR',
+        default=None,
+        help='Build the lane geometry index from an OpenDRIVE file, benchmark nearest-lane queries and exit (no CARLA server needed)')
+    args = argparser.parse_args(argv)
 
     try:
         args.width, args.height = [int(x) for x in args.res.split('x')]
@@ -1633,12 +4475,60 @@ def main():
         logging.error("Invalid resolution format for --res. Expected WIDTHxHEIGHT (e.g., 1280x720). Using default.")
         args.width, args.height = 1280, 720 
 
+    if args.render_scale != 'auto':
+        try:
+            if not 0.1 <= float(args.render_scale) <= 1.0:
+                raise ValueError
+        except ValueError:
+            logging.error("Invalid --render-scale. Expected a number between 0.1 and 1.0 or 'auto'. Using 1.0.")
+            args.render_scale = '1.0'
+
+    if args.audio_buffer < 64 or args.audio_buffer & (args.audio_buffer - 1):
+        logging.error(f"Invalid --audio-buffer {args.audio_buffer}. Expected a power of two >= 64. Using {AUDIO_BUFFER_SAMPLES}.")
+        args.audio_buffer = AUDIO_BUFFER_SAMPLES
+
+    if args.warm_sensors < 0:
+        logging.error(f"Invalid --warm-sensors {args.warm_sensors}. Expected 0 or more. Using 0.")
+        args.warm_sensors = 0
+
+    rig_streams = []
+    for spec in args.rig:
+        try:
+            stream = parse_rig_stream(spec, (args.width, args.height))
+        except ValueError as e:
+            logging.error(f"Invalid --rig stream '{spec}': {e}. Skipping.")
+            continue
+        if stream.name in [s.name for s in rig_streams]:
+            logging.error(f"--rig stream '{stream.name}' given twice. Using the first.")
+            continue
+        rig_streams.append(stream)
+    args.rig = rig_streams
+    if args.rig and not args.sync:
+        args.sync = True # Bundles are joined on the frames of client-driven ticks
+    if args.stand_in:
+        args.sync = True # The stand-in world only advances on client ticks
+        args.no_launch_carla = True
+    return args
+
+
+def main():
+    args = parse_arguments()
 
     log_level = logging.DEBUG if args.debug else logging.INFO
     logging.basicConfig(format='%(levelname)s: %(message)s', level=log_level)
     logging.info('listening to server %s:%s', args.host, args.port)
     print(__doc__) 
 
+    if args.benchmark_frame_path:
+        pygame.init()
+        benchmark_frame_path(args.width, args.height)
+        pygame.quit()
+        return
+
+    if args.benchmark_lane_index:
+        benchmark_lane_index(args.benchmark_lane_index)
+        return
+
     global carla_server_process
 
     try:
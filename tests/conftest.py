@@ -0,0 +1,31 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'CARLA_simulation_v0.1.42_functional.py')
+
+
+@pytest.fixture(scope='session')
+def sim():
+    """The simulation script loaded as a module (its file name is not importable)."""
+    pytest.importorskip('carla')
+    pytest.importorskip('pygame')
+    # No window or audio device in CI; SDL reads these at pygame.init()
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    spec = importlib.util.spec_from_file_location('carla_simulation', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def workdir(sim, tmp_path, monkeypatch):
+    """Runs the test in tmp_path, so _out/ exports and the font path cache stay out of the tree and home."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sim.FONT_PATH_CACHE, 'path', str(tmp_path / 'fonts.json'))
+    return tmp_path
@@ -0,0 +1,36 @@
+import types
+
+
+def make_camera_manager(sim, warm_sensors):
+    world = sim.StandInWorld()
+    vehicle = world.spawn_actor(world.get_blueprint_library().find('vehicle.standin.car'), sim.carla.Transform())
+    hud = types.SimpleNamespace(dim=(64, 48), headless=False, profiler=sim.FrameProfiler(),
+                                notification=lambda *args, **kwargs: None, error=lambda *args, **kwargs: None)
+    manager = sim.CameraManager(vehicle, hud, warm_sensors=warm_sensors)
+    return world, manager
+
+
+def live_sensors(world):
+    return sorted(actor.type_id for actor in world._actors.values() if actor.type_id.startswith('sensor.'))
+
+
+def test_pool_holds_only_the_displayed_sensor_by_default(sim):
+    world, manager = make_camera_manager(sim, warm_sensors=0)
+    manager.set_sensor(0, notify=False)
+    manager.next_sensor()
+    manager.next_sensor()
+    assert len(manager._sensor_pool) == 1
+    assert live_sensors(world) == [manager.sensors[2][0]]
+    manager.stop_worker()
+
+
+def test_pool_follows_the_displayed_sensor_neighbours(sim):
+    world, manager = make_camera_manager(sim, warm_sensors=1)
+    manager.set_sensor(3, notify=False)
+    wanted = {manager.sensors[i][0] for i in (2, 3, 4)}
+    assert {key[0] for key in manager._sensor_pool} == wanted
+    assert len(manager._sensor_pool) < len({item[0] for item in manager.sensors})
+    manager.next_sensor()
+    assert {key[0] for key in manager._sensor_pool} == {manager.sensors[i][0] for i in (3, 4, 5)}
+    assert len(live_sensors(world)) == len(manager._sensor_pool) # Sensors that left the pool were destroyed
+    manager.stop_worker()
@@ -0,0 +1,19 @@
+def test_since_is_empty_after_a_quiet_period(sim):
+    history = sim.CollisionHistory(capacity=8)
+    history.append(10, 0.5, 7, 'vehicle.tesla.model3', (3.0, 4.0, 0.0), 30.0)
+    history.append(20, 1.0, 7, 'vehicle.tesla.model3', (0.0, 0.0, 1.0), 28.0)
+
+    assert history.since(1.0, now=1.2)['frame'].tolist() == [10, 20]
+    assert history.since(1.0, now=1.9)['frame'].tolist() == [20]
+    assert history.since(1.0, now=12.0).size == 0 # Ten quiet seconds later
+
+
+def test_ring_keeps_the_newest_events_in_order(sim):
+    history = sim.CollisionHistory(capacity=4)
+    for frame in range(6):
+        history.append(frame, frame * 0.05, -1, '', (0.0, 0.0, 0.0), 0.0)
+
+    records = history.records()
+    assert history.total == 6 and len(history) == 4
+    assert records['frame'].tolist() == [2, 3, 4, 5]
+    assert history.since(0.1, now=0.25)['frame'].tolist() == [3, 4, 5]
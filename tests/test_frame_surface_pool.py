@@ -0,0 +1,22 @@
+def test_checked_out_surface_is_not_handed_back_to_the_producer(sim):
+    pool = sim.FrameSurfacePool(limit=2)
+    first = pool.acquire(8, 4)
+    pool.publish(first)
+    held = pool.checkout() # e.g. a RenderFrame still waiting to be blitted
+
+    second = pool.acquire(8, 4)
+    assert second is not held
+    pool.publish(second)
+    # first is no longer current but still checked out, so the pool is exhausted and the frame is dropped
+    assert pool.acquire(8, 4) is None and pool.dropped == 1
+
+    pool.release(held)
+    assert pool.acquire(8, 4) is held
+
+
+def test_superseded_render_frame_is_returned_to_the_producer(sim):
+    buffer = sim.DoubleBuffer()
+    assert buffer.publish('a') is None
+    assert buffer.publish('b') == 'a' # Never consumed
+    assert buffer.wait_latest(timeout=0) == 'b'
+    assert buffer.publish('c') is None
@@ -0,0 +1,42 @@
+import logging
+
+
+def test_headless_run_against_stand_in_world(sim, workdir, caplog):
+    args = sim.parse_arguments(['--headless', '--stand-in', '--max-frames', '5', '--res', '320x240'])
+    assert args.sync and args.no_launch_carla
+    client = sim.StandInClient()
+
+    with caplog.at_level(logging.INFO):
+        sim.game_loop(args, client=client)
+
+    world = client.get_world()
+    assert world.frame == 5
+    assert not world.get_settings().synchronous_mode # Restored by CarlaSyncMode.disable()
+    errors = [r.getMessage() for r in caplog.records if r.levelno >= logging.ERROR]
+    assert errors == []
+    # Every tick delivered its camera frame, none timed out in SensorFrameQueue
+    assert not [r for r in caplog.records if 'no data for frame' in r.getMessage()]
+    assert any('Session score: 1000' in r.getMessage() for r in caplog.records)
+    assert list((workdir / '_out').glob('frame_profile_*.csv'))
+
+
+def test_stand_in_sensors_follow_sensor_tick(sim):
+    world = sim.StandInWorld()
+    settings = world.get_settings()
+    settings.synchronous_mode, settings.fixed_delta_seconds = True, 0.05
+    world.apply_settings(settings)
+    vehicle = world.spawn_actor(world.get_blueprint_library().find('vehicle.standin.car'), sim.carla.Transform())
+    blueprint = world.get_blueprint_library().find('sensor.camera.rgb')
+    blueprint.set_attribute('image_size_x', '8')
+    blueprint.set_attribute('image_size_y', '4')
+    blueprint.set_attribute('sensor_tick', '0.1')
+    camera = world.spawn_actor(blueprint, sim.carla.Transform(), attach_to=vehicle)
+    images = []
+    camera.listen(images.append)
+
+    for _ in range(4):
+        world.tick()
+
+    assert isinstance(vehicle, sim.carla.Vehicle)
+    assert [image.frame for image in images] == [1, 3]
+    assert len(images[0].raw_data) == 8 * 4 * 4
@@ -0,0 +1,97 @@
+import math
+
+import numpy as np
+
+# Two 3.5 m driving lanes either side of a solid-solid centre line: 50 m straight along +x, then a 50 m arc
+XODR = '''<?xml version="1.0" standalone="yes"?>
+<OpenDRIVE>
+  <header revMajor="1" revMinor="4" name="lane_index_test" version="1.00" north="0" south="0" east="0" west="0"/>
+  <road name="Road 0" length="100.0" id="0" junction="-1">
+    <link/>
+    <planView>
+      <geometry s="0.0" x="0.0" y="0.0" hdg="0.0" length="50.0"><line/></geometry>
+      <geometry s="50.0" x="50.0" y="0.0" hdg="0.0" length="50.0"><arc curvature="0.02"/></geometry>
+    </planView>
+    <elevationProfile><elevation s="0" a="0" b="0" c="0" d="0"/></elevationProfile>
+    <lateralProfile/>
+    <lanes>
+      <laneSection s="0.0">
+        <left>
+          <lane id="1" type="driving" level="false"><link/><width sOffset="0" a="3.5" b="0" c="0" d="0"/>
+            <roadMark sOffset="0" type="solid" weight="standard" color="standard" width="0.15"/></lane>
+        </left>
+        <center>
+          <lane id="0" type="none" level="false"><link/>
+            <roadMark sOffset="0" type="solid solid" weight="standard" color="yellow" width="0.15"/></lane>
+        </center>
+        <right>
+          <lane id="-1" type="driving" level="false"><link/><width sOffset="0" a="3.5" b="0" c="0" d="0"/>
+            <roadMark sOffset="0" type="broken" weight="standard" color="standard" width="0.15"/></lane>
+        </right>
+      </laneSection>
+    </lanes>
+  </road>
+</OpenDRIVE>
+'''
+
+
+def brute_force(waypoints, location):
+    """Nearest lane-centre waypoint and the signed offset to the right of its direction."""
+    nearest = min(waypoints, key=lambda w: w.transform.location.distance(location))
+    right = nearest.transform.get_right_vector()
+    offset = (location.x - nearest.transform.location.x) * right.x + (location.y - nearest.transform.location.y) * right.y
+    return nearest, offset
+
+
+def test_match_agrees_with_brute_force_nearest_waypoint(sim):
+    carla = sim.carla
+    carla_map = carla.Map('lane_index_test', XODR)
+    index = sim.LaneGeometryIndex.from_map(carla_map, spacing=2.0)
+    waypoints = [w for w in carla_map.generate_waypoints(2.0) if w.lane_type == carla.LaneType.Driving]
+    assert len(index) == len(waypoints)
+
+    rng = np.random.default_rng(7)
+    for w in rng.choice(waypoints, 200):
+        location = w.transform.location + carla.Location(*rng.uniform(-1.5, 1.5, 2), 0.0)
+        match = index.match(location)
+        nearest, offset = brute_force(waypoints, location)
+        assert math.isclose(match.distance, nearest.transform.location.distance(location), abs_tol=1e-4)
+        assert (match.road_id, match.lane_id) == (nearest.road_id, nearest.lane_id)
+        assert math.isclose(match.lateral_offset, offset, abs_tol=1e-4)
+
+
+def test_lateral_offset_is_positive_to_the_right_of_the_lane(sim):
+    carla = sim.carla
+    index = sim.LaneGeometryIndex.from_map(carla.Map('lane_index_test', XODR), spacing=2.0)
+    # Lane -1 runs along +x at y = 1.75 (CARLA's y axis points to the right of +x)
+    right = index.match(carla.Location(x=10.0, y=2.25))
+    left = index.match(carla.Location(x=10.0, y=1.25))
+    assert right.lane_id == left.lane_id == -1
+    assert math.isclose(right.lateral_offset, 0.5, abs_tol=1e-4)
+    assert math.isclose(left.lateral_offset, -0.5, abs_tol=1e-4)
+    assert (right.left_marking, right.right_marking) == ('SolidSolid', 'Broken')
+    # Lane 1 runs the other way along y = -1.75, so the road edge is to its right as well
+    opposite = index.match(carla.Location(x=10.0, y=-2.25))
+    assert opposite.lane_id == 1 and math.isclose(opposite.lateral_offset, 0.5, abs_tol=1e-4)
+
+
+def test_from_xodr_reads_the_file(sim, tmp_path):
+    path = tmp_path / 'lane_index_test.xodr'
+    path.write_text(XODR)
+    index = sim.LaneGeometryIndex.from_xodr(str(path), spacing=2.0)
+    assert index.match(sim.carla.Location(x=10.0, y=1.75)).distance < 1e-4
+
+
+def test_state_cache_switches_to_the_index_within_a_frame(sim):
+    # The index can be assigned between two lookups of the same (repeating, in asynchronous mode) frame
+    carla = sim.carla
+    cache = sim.ActorStateCache()
+    cache.map = carla.Map('lane_index_test', XODR)
+    cache.frame, cache.transform = 5, carla.Transform(carla.Location(x=10.0, y=2.25))
+    waypoint, _ = cache.lane_waypoint(None)
+    assert isinstance(waypoint, carla.Waypoint)
+
+    cache.lane_index = sim.LaneGeometryIndex.from_map(cache.map, spacing=2.0)
+    match, direction = cache.lane_waypoint(None)
+    assert isinstance(match, sim.LaneMatch) and math.isclose(match.lateral_offset, 0.5, abs_tol=1e-4)
+    assert math.isclose(direction[0], 1.0)
@@ -0,0 +1,44 @@
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run(controller, clock, frame_times, dt):
+    """Feeds frame times (seconds) one per frame, advancing the clock by `dt` each; returns the scale changes."""
+    changes = []
+    for frame_time in frame_times:
+        clock.now += dt
+        change = controller.update(frame_time)
+        if change is not None:
+            changes.append(change)
+    return changes
+
+
+def test_scale_holds_steady_in_sync_mode(sim):
+    # --sync --fixed-dt 0.05: the loop is paced to 20 fps and the server FPS reads 20 whatever the load,
+    # so the controller gets the unpaced loop time against the fixed step instead
+    clock = FakeClock()
+    controller = sim.RenderScaleController(1.0 / 0.05, clock=clock)
+    assert run(controller, clock, [0.05 * 0.9] * 600, dt=0.05) == [] # Within the step, too little headroom to step up
+    assert controller.scale == 1.0
+
+
+def test_single_slow_frames_do_not_step_down(sim):
+    clock = FakeClock()
+    controller = sim.RenderScaleController(60, clock=clock)
+    frame_times = [1.0 / 60 if n % 10 else 3.0 / 60 for n in range(1200)] # A 3x spike every 10th frame
+    assert run(controller, clock, frame_times, dt=1.0 / 60) == []
+
+
+def test_steps_down_under_sustained_load_and_recovers(sim):
+    clock = FakeClock()
+    controller = sim.RenderScaleController(60, cooldown_seconds=5.0, clock=clock)
+    assert run(controller, clock, [1.5 / 60] * 440, dt=1.5 / 60) == [0.85, 0.75] # One step per 5 s cooldown
+    # Load gone: back up one level per cooldown, not before
+    changes = run(controller, clock, [0.5 / 60] * 60, dt=0.5 / 60)
+    assert changes == [] # Only 0.5 s since the last change
+    changes = run(controller, clock, [0.5 / 60] * 1200, dt=0.5 / 60)
+    assert changes == [0.85, 1.0] and controller.scale == 1.0
@@ -0,0 +1,37 @@
+import os
+import stat
+
+
+class FakeHUD(object):
+    def __init__(self):
+        self.notifications, self.errors = [], []
+
+    def notification(self, text, **kwargs):
+        self.notifications.append(text)
+
+    def error(self, text):
+        self.errors.append(text)
+
+
+def fake_ffmpeg(tmp_path):
+    """Stands in for ffmpeg: copies the raw frames on stdin to the output path (the last argument)."""
+    path = tmp_path / 'ffmpeg'
+    path.write_text('#!/bin/sh\nfor arg in "$@"; do out="$arg"; done\ncat > "$out"\n')
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_frame_size_change_starts_a_new_segment(sim, tmp_path):
+    hud = FakeHUD()
+    video = sim.VideoRecorder(str(tmp_path / 'session.mp4'), fps=10, ffmpeg=fake_ffmpeg(tmp_path), hud=hud)
+    for n in range(3):
+        video.submit(b'\x01' * (8 * 4 * 4), (8, 4), timestamp=n * 0.1)
+    for n in range(3, 5): # e.g. --render-scale auto stepped the camera down
+        video.submit(b'\x02' * (6 * 3 * 4), (6, 3), timestamp=n * 0.1)
+    video.close()
+
+    assert video.segments == [str(tmp_path / 'session.mp4'), str(tmp_path / 'session_001.mp4')]
+    assert os.path.getsize(video.segments[0]) == 3 * 8 * 4 * 4
+    assert os.path.getsize(video.segments[1]) == 2 * 6 * 3 * 4
+    assert video.frames_written == 5 and video.frames_skipped == 0
+    assert hud.notifications == ['Video continues in a new file at 6x3'] and hud.errors == []